@@ -0,0 +1,67 @@
+"""
+Latency of creating a channel pair against a fake HTTP layer\n
+-> make_channel issues both creations at once, create_channels_for moves the creator and sends the welcome
+message at once - so a creation should take about two round trips instead of four
+
+Run from the src directory: python -m benchmarks.channel_creation [latency in ms] [runs]
+"""
+
+import asyncio
+import sys
+import time
+import types
+
+from benchmarks.fakes import use_in_memory_database, FakeHTTP, FakeGuild, FakeCategory, FakeMember, join, describe
+
+use_in_memory_database()
+
+import database.db_models as db  # noqa: E402 - needs the in-memory database
+from cogs.on_voice_update import make_channel, VCCreator  # noqa: E402
+
+
+async def bench_make_channel(latency: float, runs: int):
+    http = FakeHTTP(latency)
+    latencies = []
+    for _ in range(runs):
+        # a new guild per run - the route budget of one guild would limit the creations otherwise
+        guild = FakeGuild(http)
+        trigger = await guild.create_voice_channel("create", category=FakeCategory(guild))
+        member, bot_member = join(guild, trigger), FakeMember(guild, "bot")
+
+        start = time.perf_counter()
+        await make_channel(member.voice, member, bot_member, {})
+        latencies.append(time.perf_counter() - start)
+
+    # voice and text channel creation
+    describe("make_channel", latencies, latency, sequential_calls=2)
+
+
+async def bench_create_channels_for(latency: float, runs: int):
+    http = FakeHTTP(latency)
+    # only the bot attribute of the cog is used - avoids starting the reconcile loop
+    cog = types.SimpleNamespace(bot=None)
+    latencies = []
+    for _ in range(runs):
+        guild = FakeGuild(http)
+        trigger = await guild.create_voice_channel("create", category=FakeCategory(guild))
+        member, bot_member = join(guild, trigger), FakeMember(guild, "bot")
+        session = db.open_session()
+
+        start = time.perf_counter()
+        await VCCreator.create_channels_for(cog, member, member.voice, "public_channel", bot_member, session,
+                                            log_channel=None, archive_category=None)
+        latencies.append(time.perf_counter() - start)
+        session.close()
+
+    # voice and text channel creation, move of the creator, welcome message
+    describe("create_channels_for", latencies, latency, sequential_calls=4)
+
+
+async def main(latency: float, runs: int):
+    await bench_make_channel(latency, runs)
+    await bench_create_channels_for(latency, runs)
+
+
+if __name__ == '__main__':
+    latency_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 50
+    asyncio.run(main(latency_ms / 1000, int(sys.argv[2]) if len(sys.argv) > 2 else 50))
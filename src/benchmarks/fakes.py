@@ -0,0 +1,149 @@
+"""
+Fake discord objects and an in-memory database for the benchmarks\n
+-> every REST call of the fakes sleeps for a fixed latency, so the benchmarks measure how many round trips
+a code path waits for in sequence - not discord or postgres
+"""
+
+import asyncio
+import itertools
+import os
+import statistics
+from typing import Dict, List, Union
+
+_ids = itertools.count(10 ** 17)
+
+
+def use_in_memory_database():
+    """
+    Point database.db_models to an in-memory SQLite database\n
+    Must be called before anything imports the database package
+    """
+    for key in ("POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_SERVER", "POSTGRES_DB"):
+        os.environ.setdefault(key, "benchmark")
+
+    import sqlalchemy
+    from sqlalchemy.pool import StaticPool
+
+    create_engine = sqlalchemy.create_engine
+    # one shared connection - all sessions see the same in-memory database
+    sqlalchemy.create_engine = lambda *args, **kwargs: create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    try:
+        import database.db_models  # noqa: F401 - creates the tables
+    finally:
+        sqlalchemy.create_engine = create_engine
+
+
+class FakeHTTP:
+    """ Counts the calls and delays each of them like a round trip to discord """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+
+class FakeRole:
+    def __init__(self, guild: "FakeGuild"):
+        self.id = next(_ids)
+        self.guild = guild
+
+
+class FakeCategory:
+    def __init__(self, guild: "FakeGuild"):
+        self.id = next(_ids)
+        self.guild = guild
+        self.overwrites = {}
+
+
+class FakeChannel:
+    def __init__(self, guild: "FakeGuild", name: str, category: Union[FakeCategory, None]):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.category = category
+        self.category_id = category.id if category else None
+        self.members: List["FakeMember"] = []
+        self.mention = f"<#{self.id}>"
+
+    async def edit(self, **kwargs):
+        await self.guild.http.call()
+        self.name = kwargs.get("name", self.name)
+
+    async def delete(self, reason=None):
+        await self.guild.http.call()
+        self.guild.channels.pop(self.id, None)
+
+    async def send(self, *args, **kwargs):
+        await self.guild.http.call()
+
+
+class FakeVoiceState:
+    def __init__(self, channel: FakeChannel):
+        self.channel = channel
+
+
+class FakeMember:
+    def __init__(self, guild: "FakeGuild", name="member"):
+        self.id = next(_ids)
+        self.guild = guild
+        self.display_name = name
+        self.mention = f"<@{self.id}>"
+        self.bot = False
+        self.voice: Union[FakeVoiceState, None] = None
+
+    async def move_to(self, channel: FakeChannel, reason=None):
+        await self.guild.http.call()
+        if self.voice:
+            self.voice.channel.members.remove(self)
+        channel.members.append(self)
+        self.voice = FakeVoiceState(channel)
+
+    def __str__(self):
+        return self.display_name
+
+
+class FakeGuild:
+    def __init__(self, http: FakeHTTP):
+        self.id = next(_ids)
+        self.http = http
+        self.default_role = FakeRole(self)
+        self.channels: Dict[int, FakeChannel] = {}
+
+    def get_channel(self, channel_id: int) -> Union[FakeChannel, None]:
+        return self.channels.get(channel_id)
+
+    def get_role(self, role_id: int) -> None:
+        return None
+
+    async def _create(self, name: str, category: Union[FakeCategory, None]) -> FakeChannel:
+        await self.http.call()
+        channel = FakeChannel(self, name, category)
+        self.channels[channel.id] = channel
+        return channel
+
+    async def create_voice_channel(self, name, category=None, overwrites=None, reason=None):
+        return await self._create(name, category)
+
+    async def create_text_channel(self, name, category=None, overwrites=None, reason=None):
+        return await self._create(name, category)
+
+
+def join(guild: FakeGuild, channel: FakeChannel, name="member") -> FakeMember:
+    """ A member that is connected to the given channel """
+    member = FakeMember(guild, name)
+    member.voice = FakeVoiceState(channel)
+    channel.members.append(member)
+    return member
+
+
+def describe(name: str, latencies: List[float], latency: float, sequential_calls: int):
+    """ Print percentiles of the measured latencies, in round trips and in milliseconds """
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name}: n={len(latencies)} "
+          f"median={statistics.median(latencies) * 1000:.1f}ms p95={p95 * 1000:.1f}ms "
+          f"(~{statistics.median(latencies) / latency:.1f} round trips, {sequential_calls} if issued in sequence)")
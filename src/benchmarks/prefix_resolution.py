@@ -0,0 +1,84 @@
+"""
+Messages per second the bot can turn away or hand to command processing\n
+-> the prefixes of a guild are cached, so plain chat is rejected without a database query - compared with
+loading the prefixes for every message like the prefix callable did before
+
+Run from the src directory: python -m benchmarks.prefix_resolution [messages]
+"""
+
+import asyncio
+import sys
+import time
+import types
+
+from benchmarks.fakes import use_in_memory_database
+
+use_in_memory_database()
+
+import database.access_settings_db as settings_db  # noqa: E402 - needs the in-memory database
+import database.prefix_cache as prefix_cache  # noqa: E402
+from helpers.message_ingress import message_ingress  # noqa: E402
+
+bot_id = 1
+guild_id = 2
+
+
+class FakeBot:
+    """ Only counts the messages that would be processed as commands """
+
+    def __init__(self):
+        self.user = types.SimpleNamespace(id=bot_id)
+        self.processed = 0
+
+    async def process_commands(self, message):
+        self.processed += 1
+
+
+def make_message(content: str, bot=False):
+    author = types.SimpleNamespace(id=3, bot=bot)
+    return types.SimpleNamespace(content=content, author=author, webhook_id=None,
+                                 guild=types.SimpleNamespace(id=guild_id), channel=types.SimpleNamespace(id=4))
+
+
+def report(name: str, count: int, seconds: float):
+    print(f"{name}: {count / seconds:,.0f} messages/s ({seconds / count * 10 ** 6:.1f}µs per message)")
+
+
+def bench_get_prefixes(count: int):
+    start = time.perf_counter()
+    for _ in range(count):
+        prefix_cache.get_prefixes(guild_id, bot_id)
+    report("get_prefixes (cached)", count, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(count):
+        prefix_cache.invalidate(guild_id)
+        prefix_cache.get_prefixes(guild_id, bot_id)
+    report("get_prefixes (query per message)", count, time.perf_counter() - start)
+
+
+async def bench_dispatch(count: int):
+    # mostly chat, like on a busy guild - some commands and some messages of other bots
+    messages = [make_message("hello there"), make_message("f!help"), make_message("what's up", bot=True),
+                make_message("! not a command"), make_message("so what about it")]
+
+    for name, sample in (("dispatch (mixed)", messages), ("dispatch (chat only)", [messages[0]])):
+        bot = FakeBot()
+        start = time.perf_counter()
+        for i in range(count):
+            await message_ingress.dispatch(bot, sample[i % len(sample)])
+        report(name, count, time.perf_counter() - start)
+
+    print(message_ingress.stats())
+
+
+async def main(count: int):
+    settings_db.add_setting(guild_id, "prefix", "f!")
+    settings_db.add_setting(guild_id, "prefix", "!!")
+
+    bench_get_prefixes(count)
+    await bench_dispatch(count)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000))
@@ -12,6 +12,7 @@ from environment import PREFIX, OWNER_NAME, OWNER_ID
 import utils
 import database.access_settings_db as settings_db
 import database.access_channels_db as channels_db
+import helpers.metrics as metrics
 
 
 class Admin(commands.Cog):
@@ -34,6 +35,19 @@ class Admin(commands.Cog):
         settings_db.del_setting_by_value(ctx.guild.id, int(arg))
         await ctx.send("Done")
 
+    @commands.command("metrics", hidden=True)
+    async def show_metrics(self, ctx):
+        """ Show runtime metrics, guild specific values are given for the current guild """
+        if ctx.author.id != OWNER_ID:
+            return
+
+        emby = discord.Embed(title="Metrics", color=utils.blue_light)
+        for section, values in metrics.collect(ctx.guild.id if ctx.guild else None).items():
+            text = "\n".join(f"{name}: `{value}`" for name, value in values.items())
+            emby.add_field(name=section, value=text or "-", inline=False)
+
+        await ctx.send(embed=emby)
+
     # ROLE ID
     @commands.command(name="role-id", aliases=["roleid", "rid", "r-id"],
                       help="Mention a role or just give its name to get the roles ID\n Aliases: `roleid`, `rid`, `r-id`")
@@ -1,15 +1,52 @@
+import asyncio
+import logging
 import random
-from typing import List
+import re
+import time
+from datetime import datetime, timedelta
+from typing import List, Tuple, Union, Hashable
 
 import discord
 from discord.ext import commands
 
-from environment import PREFIX
+from environment import PREFIX, BREAKOUT_CREATION_CONCURRENCY
 import utils
 import database.db_models as db
 import database.access_channels_db as channels_db
+import database.overwrite_templates as overwrite_templates
+import database.breakout_sessions as breakout_sessions
+import database.access_breakout_db as breakout_db
 import cogs.help as hp
-from cogs.on_voice_update import make_channel
+from cogs.on_voice_update import make_channel, update_channel_overwrites, text_channel_overwrites
+from helpers.expected_moves import expected_moves
+from helpers.bulk_moves import bulk_mover, MoveReport
+from helpers.timer_heap import TimerHeap
+from helpers.progress import Progress
+import helpers.rest_scheduler as rest
+from helpers.rest_scheduler import Priority
+from helpers.guild_scheduler import guild_scheduler
+from helpers.voice_events import voice_events
+
+logger = logging.getLogger('my-bot')
+
+# seconds before the end of a timed session the rooms are warned
+warning_time = 60
+# longest duration of a timed session
+max_duration = 24 * 60 * 60
+
+
+def parse_duration(text: str) -> Union[int, None]:
+    """
+    Parse durations like '15m', '90s' or '1h' - plain numbers are minutes
+
+    :returns: seconds, None if the text isn't a valid duration
+    """
+    match = re.fullmatch(r"(\d+)([smh]?)", text.strip().lower())
+    if not match:
+        return None
+
+    seconds = int(match.group(1)) * {"s": 1, "": 60, "m": 60, "h": 3600}[match.group(2)]
+    return seconds if 0 < seconds <= max_duration else None
 
 
 class Breakout(commands.Cog):
@@ -19,16 +56,237 @@ class Breakout(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        # one timer task for the warnings and closures of all timed sessions
+        self.timers = TimerHeap(self.fire_timers)
+        self.rehydrated = False
+
+    async def cog_before_invoke(self, ctx: commands.Context):
+        # commands share the slots of their guild with the voice handling
+        if ctx.guild:
+            await guild_scheduler.acquire(ctx.guild.id)
+
+    async def cog_after_invoke(self, ctx: commands.Context):
+        if ctx.guild:
+            guild_scheduler.release(ctx.guild.id)
+
+    @staticmethod
+    async def update_base_channel(base_vc: discord.VoiceChannel, bot_member: discord.Member):
+        """ Update the linked text channel of the channel members were moved out of / into, if it has one """
+        # fresh session - the text channel of a static base channel may have been recreated in the meantime
+        session = db.open_session()
+        base_entry = channels_db.get_voice_channel_by_id(base_vc.id, session)
+        session.close()
+        if base_entry and base_entry.text_channel_id:
+            await update_channel_overwrites(base_vc, base_entry, bot_member)
+
+    @staticmethod
+    async def move_members(progress: Progress,
+                           moves: List[Tuple[discord.Member, discord.VoiceChannel]],
+                           reason: str) -> MoveReport:
+        """
+        Move members concurrently, the voice handler skips these moves\n
+        Counts the moves and the members that couldn't be moved on the status message of the command
+
+        :param progress: status message of the command
+        :param moves: list of (member, channel the member shall be moved to)
+        :param reason: reason shown in the audit log
+
+        :returns: report of moved and failed members
+        """
+        for member, channel in moves:
+            expected_moves.expect(member, channel)
+
+        def on_result(member: discord.Member, failure: Union[str, None]):
+            if failure:
+                progress.fail(f"{member.display_name}: {failure}")
+            else:
+                progress.advance("Members moved")
+
+        progress.total("Members moved", len(moves))
+        report = await bulk_mover.move(moves, reason, on_result=on_result)
+        for member, _ in report.failed:
+            expected_moves.discard(member)
+
+        return report
+
+    @staticmethod
+    def get_kept_rooms(guild: discord.Guild, session: Union[breakout_sessions.BreakoutSession, None]) \
+            -> List[Tuple[discord.VoiceChannel, Union[discord.TextChannel, None]]]:
+        """ Rooms an idle session kept from its last round, in the order they were created """
+        if session is None or not session.idle:
+            return []
+
+        entries = channels_db.get_channels_by_ids(sorted(session.room_ids))
+        rooms = [(guild.get_channel(entry.voice_channel_id), guild.get_channel(entry.text_channel_id or 0))
+                 for entry in sorted(entries, key=lambda e: e.voice_channel_id)]
+        return [(voice_channel, text_channel) for voice_channel, text_channel in rooms if voice_channel]
+
+    @staticmethod
+    async def prepare_kept_room(text_channel: Union[discord.TextChannel, None], room_members: List[discord.Member],
+                                bot_member: discord.Member, reason="New breakout round"):
+        """
+        Give the members of the new round access to the text channel of a kept room
+
+        Without members the text channel is reset to the template, so the last round can't use it while it's idle
+        """
+        if text_channel is None:
+            return
+
+        overwrites = text_channel_overwrites(text_channel.guild, room_members, bot_member)
+        try:
+            await rest.run(Priority.PERMISSION, ("channel", text_channel.id),
+                           lambda: text_channel.edit(overwrites=overwrites, reason=reason))
+        except discord.HTTPException as e:
+            logger.warning(f"Couldn't prepare kept breakout room {text_channel.id}: {e}")
+
+    async def remove_rooms(self, guild: discord.Guild, rooms: List[discord.VoiceChannel]):
+        """ Remove empty rooms - no voice event will remove them, since nobody leaves them """
+        await self.bot.get_cog("VCCreator").bulk_tear_down(guild, rooms)
+
+    def schedule_close(self, session: breakout_sessions.BreakoutSession):
+        """ Schedule the closure of a timed session and the warning before it """
+        due = session.closes_at.timestamp()
+        self.timers.schedule(("close", session.guild_id, session.id), due)
+
+        # no warning for sessions that end within the warning time
+        if due - warning_time > time.time():
+            self.timers.schedule(("warn", session.guild_id, session.id), due - warning_time)
+
+    def cancel_close(self, session: breakout_sessions.BreakoutSession):
+        self.timers.cancel(("close", session.guild_id, session.id))
+        self.timers.cancel(("warn", session.guild_id, session.id))
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # timers of timed sessions don't survive a restart - schedule them again from the database
+        # on_ready fires again after reconnects, the timers of this process are still live then
+        if self.rehydrated:
+            return
+        self.rehydrated = True
+
+        for entry in breakout_db.get_timed_sessions():
+            if self.timers.due_at(("close", entry.guild_id, entry.id)) is not None:
+                continue
+            self.timers.schedule(("close", entry.guild_id, entry.id), entry.closes_at.timestamp())
+
+            if entry.closes_at.timestamp() - warning_time > time.time():
+                self.timers.schedule(("warn", entry.guild_id, entry.id), entry.closes_at.timestamp() - warning_time)
+
+    async def fire_timers(self, batch: List[Hashable]):
+        """ Warn and close all sessions whose timer is due - called by the timer heap """
+        warnings, closures = [], []
+        for kind, guild_id, session_id in batch:
+            guild: discord.Guild = self.bot.get_guild(guild_id)
+            session = breakout_sessions.get_by_id(guild_id, session_id) if guild else None
+            if session is None:  # session was closed by hand or the bot left the guild
+                continue
+
+            # the session was reopened or its timer removed since the timer was scheduled
+            due = session.closes_at.timestamp() - (warning_time if kind == "warn" else 0) \
+                if session.closes_at else None
+            if due is None or due > time.time() + self.timers.batch_window:
+                continue
+            (warnings if kind == "warn" else closures).append((guild, session))
+
+        # text channels of all warned rooms with one query
+        room_ids = [room_id for _, session in warnings for room_id in session.room_ids]
+        text_channels = [self.bot.get_channel(entry.text_channel_id)
+                         for entry in channels_db.get_channels_by_ids(room_ids) if entry.text_channel_id]
+
+        await asyncio.gather(
+            *(rest.run(Priority.MESSAGE, ("messages", channel.id), lambda channel=channel: channel.send(
+                embed=utils.make_embed(name="This room closes in one minute",
+                                       value="Everybody will be moved back to the main channel.",
+                                       color=utils.yellow)))
+              for channel in text_channels if channel),
+            *(self.close_timed_session(guild, session) for guild, session in closures),
+            return_exceptions=True
+        )
+
+    async def close_timed_session(self, guild: discord.Guild, session: breakout_sessions.BreakoutSession):
+        # timers do handler work too - they share the slots of their guild
+        async with guild_scheduler.slot(guild.id):
+            await self.close_session(guild, session)
+
+    async def close_session(self, guild: discord.Guild, session: breakout_sessions.BreakoutSession,
+                            progress: Union[Progress, None] = None,
+                            fallback_channel: Union[discord.VoiceChannel, None] = None,
+                            keep_rooms=False) -> Tuple[Union[discord.VoiceChannel, None], MoveReport]:
+        """
+        Move all members of the rooms of a session back to its base channel and end the session
+
+        :param guild: guild the session runs on
+        :param session: session to close
+        :param progress: status message if a command closes the session - moves and failures are shown there
+        :param fallback_channel: channel members are moved to if the base channel was deleted
+        :param keep_rooms: keep the empty rooms and the session for the next round
+
+        :returns: the channel members were moved to - None if there was none, report of the moves
+        """
+        self.cancel_close(session)
+        progress = progress or Progress(None, "Closing breakout rooms")
+
+        # collect members of all break out rooms of the session, moving members back in main channel
+        back_channel = guild.get_channel(session.base_channel_id) or fallback_channel
+        moves = []
+        rooms = []
+        for room_id in session.room_ids:
+            ch: discord.VoiceChannel = guild.get_channel(room_id)
+            if ch is None or back_channel is None:  # channel already deleted
+                continue
+            moves.extend((m, back_channel) for m in ch.members)
+            rooms.append(ch)
+
+        # kept rooms wait for the next round - set before the moves, so the rooms aren't removed
+        if keep_rooms:
+            breakout_sessions.set_idle(session, True)
+            if session.closes_at:
+                breakout_sessions.set_closes_at(session, None)
+            with progress.phase("moves"):
+                report = await self.move_members(progress, moves, reason="Breakout rooms closed")
+
+            # members moved out as expected moves don't lose access to the text channels - reset them instead
+            bot_member = guild.get_member(self.bot.user.id)
+            with progress.phase("reset"):
+                await asyncio.gather(*[self.prepare_kept_room(text_channel, [], bot_member,
+                                                              reason="Breakout round closed")
+                                       for _, text_channel in self.get_kept_rooms(guild, session)])
+
+        # the session is over - all rooms are removed together once the members are moved out
+        # rooms are claimed before the moves, so the voice handler doesn't tear them down one by one
+        else:
+            breakout_sessions.close_session(session)
+            claimed = [room for room in rooms if voice_events.begin_deletion(room.id)]
+            report = None
+            try:
+                with progress.phase("moves"):
+                    report = await self.move_members(progress, moves, reason="Breakout rooms closed")
+            finally:
+                # moved members can still be listed in their room until their voice event arrives
+                # rooms of members that couldn't be moved stay until they leave
+                with progress.phase("removal"):
+                    await self.bot.get_cog("VCCreator").bulk_tear_down(
+                        guild, claimed, claimed=True,
+                        gone={member.id for member in report.moved} if report else set())
+
+        # add all returned members to the linked text channel of the back channel at once
+        if back_channel:
+            with progress.phase("overwrites"):
+                await self.update_base_channel(back_channel, guild.get_member(self.bot.user.id))
+
+        return back_channel, report
 
     @commands.command(name="open", aliases=["bor", "brout", "break-out", "opro", "openroom"],
                       help=f"""
-                            Usage: `{PREFIX}break-out [members per channel]`\n
+                            Usage: `{PREFIX}break-out [members per channel] [optional: duration]`\n
                             Creates breakout channels with given amount of members\n
                             Members must be in same channel as you are
                             The distribution is randomized\n
                             Channel settings are the same as in your current channel\n
                             Linked text channels will be created too\n
                             Rooms created with this command behave like other channels created by the bot
+                            With a duration like `15m`, `90s` or `1h` the rooms are closed automatically, \
+                            they're warned one minute before\n
                             Empty VCs are deleted. Linked TCs will be deleted or archived as set in the settings\n
                             Alias:`openroom`, `opro`, `break-out`, `brout`, `bor`\n\n
                             Requires kick permissions.
@@ -42,6 +300,8 @@ class Breakout(commands.Cog):
                                                             value="Please enter a Voice Channel and try again"))
             return
 
+        arguments = split
+
         # ensuring members var is given and is int
         try:
             # check can fail when typecast fails or number too small
@@ -61,6 +321,14 @@ class Breakout(commands.Cog):
                                                                   f"Example: `{PREFIX}open 4`"))
             return
 
+        # optional duration of the session
+        duration = parse_duration(arguments[1]) if len(arguments) > 1 else None
+        if len(arguments) > 1 and duration is None:
+            await hp.send_embed(ctx, embed=utils.make_embed("Wrong duration", utils.orange,
+                                                            value=f"Please enter a duration up to 24 hours\n"
+                                                                  f"Example: `{PREFIX}open 4 15m`"))
+            return
+
         # channel invoker is based in
         base_vc: discord.VoiceChannel = ctx.author.voice.channel
 
@@ -72,70 +340,136 @@ class Breakout(commands.Cog):
         members.remove(ctx.author)  # invoker should not be moved to break-out-room
         random.shuffle(members)  # shuffling list
 
-        overwrites = base_vc.category.overwrites  # settings for new channels
-        mv_channel = None  # temp var for holding current created channel
-        for i in range(len(members)):
-            """
-            Iterating trough members of VC
-            Creating new channel when last one filled
-            Moving members
-            """
-            if i % split == 0:
-                mv_channel, _ = await make_channel(ctx.author.voice, members[i], bot_member, overwrites,
-                                                   vc_name=f"Breakout Room {i // split + 1}",
-                                                   tc_name=f"Breakout Room {i // split + 1}",
-                                                   channel_type="breakout_room")
-            if members[i].voice is None:
-                continue
-            await members[i].move_to(mv_channel, reason="Moved to breakout room")
+        overwrites = overwrite_templates.category_template(base_vc.category)  # settings for new channels
+        voice_state: discord.VoiceState = ctx.author.voice
+
+        # assign members to rooms before anything is created
+        rooms: List[List[discord.Member]] = [members[i:i + split] for i in range(0, len(members), split)]
+        creation_slots = asyncio.Semaphore(BREAKOUT_CREATION_CONCURRENCY)
+
+        # one status message for the whole command, edited while the rooms are set up
+        progress = Progress(ctx, "Opening breakout rooms")
+        progress.total("Rooms ready", len(rooms))
+
+        # rooms kept from the last round are used first - only the difference is created or removed
+        session = breakout_sessions.get(ctx.guild.id, base_vc.id)
+        kept = self.get_kept_rooms(ctx.guild, session)
+        reused, surplus = kept[:len(rooms)], kept[len(rooms):]
+
+        async def create_room(number: int, room_members: List[discord.Member]):
+            async with creation_slots:
+                # all members of that room can see the text channel right away
+                try:
+                    channels = await make_channel(voice_state, room_members[0], bot_member, overwrites,
+                                                  vc_name=f"Breakout Room {number}",
+                                                  tc_name=f"Breakout Room {number}",
+                                                  channel_type="breakout_room",
+                                                  text_members=room_members,
+                                                  add_to_db=False)
+                except Exception as e:
+                    # members of rooms that couldn't be created stay in the base channel
+                    progress.fail(f"Breakout Room {number}: {e}, its members stay in your channel")
+                    raise
+
+                progress.advance("Rooms ready")
+                return channels
+
+        # rooms don't depend on each other - create them at once, the rest scheduler paces the creations
+        with progress.phase("rooms"):
+            created = await asyncio.gather(*(create_room(number, room_members)
+                                             for number, room_members in enumerate(rooms[len(reused):],
+                                                                                   start=len(reused) + 1)),
+                                           return_exceptions=True)
+
+        new_rooms = [(room_members, channels) for room_members, channels in zip(rooms[len(reused):], created)
+                     if not isinstance(channels, BaseException)]
+        failed = len(created) - len(new_rooms)
+        if failed:
+            logger.warning(f"Couldn't create {failed} of {len(created)} breakout rooms on {ctx.guild.id}: "
+                           f"{next(c for c in created if isinstance(c, BaseException))}")
+
+        # log all rooms at once - before the moves, so the voice handler knows the rooms
+        channels_db.add_channels([(vc.id, tc.id) for _, (vc, tc) in new_rooms], ctx.guild.id, "breakout_room",
+                                 category=base_vc.category_id, set_by=ctx.author.id)
+
+        # rooms belong to the session of the base channel, so close only touches these rooms
+        session = breakout_sessions.open_session(ctx.guild.id, base_vc.id, ctx.author.id)
+        breakout_sessions.add_rooms(session, *(vc.id for _, (vc, _) in new_rooms))
+
+        # kept rooms get the members of this round - the session runs again, so empty rooms are removed again
+        ready = list(zip(rooms, reused)) + new_rooms
+        with progress.phase("kept rooms"):
+            await asyncio.gather(*(self.prepare_kept_room(text_channel, room_members, bot_member)
+                                   for room_members, (_, text_channel) in ready[:len(reused)]))
+            progress.advance("Rooms ready", len(reused))
+            if session.idle:
+                breakout_sessions.set_idle(session, False)
+            await self.remove_rooms(ctx.guild, [voice_channel for voice_channel, _ in surplus])
+
+        # timed sessions are closed by the timer, even after a restart
+        if duration:
+            breakout_sessions.set_closes_at(session, datetime.now() + timedelta(seconds=duration))
+            self.schedule_close(session)
+
+        # overwrites are set already, the voice handler can skip these moves
+        with progress.phase("moves"):
+            report = await self.move_members(progress, [(member, mv_channel) for room_members, (mv_channel, _) in ready
+                                                        for member in room_members],
+                                             reason="Moved to breakout room")
+
+        # remove all moved members from the linked text channel of the base channel at once
+        with progress.phase("overwrites"):
+            await self.update_base_channel(base_vc, bot_member)
+
+        await progress.finish(
+            name="Done",
+            value=f"Moved {len(report.moved)} members into {len(ready)} breakout rooms." +
+                  (f"\nThe rooms are closed automatically after {arguments[1]}." if duration else "") +
+                  ("\nPlease check my permissions, some rooms couldn't be created." if failed else ""))
 
     @commands.command(name="close", aliases=["collect", "closeroom", "cbr", "clbr", "close-rooms", "cl", "cloro"],
                       help=f"""
-                            Closing all break-out rooms on server\n
-                            Members in those channels will be moved to your channel\n
+                            Closing the break-out rooms opened from your channel\n
+                            Use it in the channel you opened the rooms from or in one of the rooms\n
+                            Members in those rooms will be moved back to that channel\n
                             Break out rooms will be deleted
                             Text channels will be deleted or archived -> settings.\n
+                            Use `{PREFIX}close keep` to keep the rooms, the next `{PREFIX}open` in your channel \
+                            reuses them\n
                             Alias: `collect`, `closeroom`, `cloro`, `close-room`, `close-rooms`, `cl`, `clbr`\n\n
                             Requires kick permissions.
                             """)
     @commands.has_permissions(kick_members=True)
-    async def close_rooms(self, ctx: commands.Context):
+    async def close_rooms(self, ctx: commands.Context, *options: str):
         # check if member is not in voice
         if not ctx.author.voice:
             await hp.send_embed(ctx, embed=utils.make_embed("You're not in a VoiceChannel", utils.orange,
                                                             value="Please enter a Voice Channel and try again"))
             return
 
-        # getting break-out rooms from database
-        breakout_rooms: List[db.CreatedChannels] = channels_db.get_channels_by_type(ctx.guild.id, "breakout_room")
+        # session opened from this channel - or the session of the room the invoker is in
+        author_channel: discord.VoiceChannel = ctx.author.voice.channel
+        session = breakout_sessions.get(ctx.guild.id, author_channel.id) \
+            or breakout_sessions.get_by_room(ctx.guild.id, author_channel.id)
 
-        if not breakout_rooms:
+        if not session:
             await ctx.send(embed=utils.make_embed(
                 name="No breakout rooms open",
-                value="There are no rooms I can close.",
+                value="There are no rooms opened from this channel I can close.",
                 color=utils.yellow
             ))
 
             return
 
-        # iterating trough break out rooms, moving members back in main channel
-        # deletion of channels will be handled in separate on_voice_channel_update event when channel is empty
-        back_channel = ctx.author.voice.channel
-        for room in breakout_rooms:
-            ch: discord.VoiceChannel = ctx.guild.get_channel(room.voice_channel_id)
-            if ch is None:  # channel already deleted
-                continue
-            for m in ch.members:
-                if m.voice is None:  # member left voice chat
-                    continue
-                await m.move_to(back_channel)
+        keep_rooms = bool(options) and options[0].lower() in ("keep", "k")
+        progress = Progress(ctx, "Closing breakout rooms")
+        back_channel, report = await self.close_session(ctx.guild, session, progress=progress,
+                                                        fallback_channel=author_channel, keep_rooms=keep_rooms)
 
-        await ctx.send(embed=utils.make_embed(
+        await progress.finish(
             name="Done",
-            value=f"Moved all members from breakout rooms to your channel ({back_channel.name}).\n"
-                  "All empty rooms will be removed in a few seconds.",
-            color=utils.green
-        ))
+            value=f"Moved {len(report.moved)} members from breakout rooms to your channel ({back_channel.name}).\n" +
+                  ("The rooms are kept for the next round." if keep_rooms else "The rooms are removed."))
 
 
 def setup(bot):
@@ -6,6 +6,8 @@ import re
 import discord
 from discord.ext import commands
 
+from helpers.message_ingress import message_ingress
+
 
 class MessageListener(commands.Cog):
 	"""
@@ -13,13 +15,21 @@ class MessageListener(commands.Cog):
 	"""
 	def __init__(self, bot):
 		self.bot = bot
+		# the message ingress only calls the handler for messages that can match
+		message_ingress.add_listener(self.is_hydrated, self.react_hydrated)
+
+	def cog_unload(self):
+		message_ingress.remove_listener(self.react_hydrated)
 
-	@commands.Cog.listener()
-	async def on_message(self, message):
+	@staticmethod
+	def is_hydrated(message):
+		# one scan for both words, both contain 'hydr'
+		return "hydr" in message.content and ("hydrated" in message.content or "hydro" in message.content)
 
-		if "hydrated" in message.content or "hydro" in message.content: #a secret for my friends :)
-			#emote = self.bot.get_emoji("droplet")
-			await message.add_reaction('\N{cup with straw}')
+	async def react_hydrated(self, message):
+		#a secret for my friends :)
+		#emote = self.bot.get_emoji("droplet")
+		await message.add_reaction('\N{cup with straw}')
 
 
 def setup(bot):
@@ -1,21 +1,42 @@
-from typing import Union, Tuple, List, Dict
+from typing import Union, Tuple, List, Dict, Set
+import asyncio
+import io
+import logging
 import random
 import time
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
-from environment import PREFIX, CHANNEL_TRACK_LIMIT
+from environment import PREFIX, CHANNEL_TRACK_LIMIT, RECONCILE_INTERVAL, RECONCILE_PACE, \
+    BREAKOUT_REMOVAL_CONCURRENCY, EXPORT_MESSAGE_LIMIT
 import database.db_models as db
 import database.access_settings_db as settings_db
 import database.access_channels_db as channels_db
+import database.channel_index as channel_index
+import database.overwrite_templates as overwrite_templates
+import database.breakout_sessions as breakout_sessions
+from helpers.channel_pool import channel_pool, clean_up_pooled_channels, pool_type
+import helpers.rest_scheduler as rest
+from helpers.rest_scheduler import Priority
+from helpers.log_sink import log_sink
+from helpers.activity_tracker import activity_tracker
+from helpers.admission import admission, Verdict
+from helpers.expected_moves import expected_moves
+from helpers.voice_events import voice_events
+from helpers.guild_scheduler import guild_scheduler
+import helpers.metrics as metrics
+import cogs.help as hp
 import utils as utl
 
+logger = logging.getLogger('my-bot')
+
 
 async def make_channel(voice_state: discord.VoiceState, member: discord.Member, bot_member: discord.Member,
                        voice_overwrites: Dict[Union[discord.Member, discord.Role], discord.PermissionOverwrite],
-                       vc_name="voice-channel", tc_name="text-channel", channel_type="public") -> Tuple[
-                       discord.VoiceChannel, discord.TextChannel]:
+                       vc_name="voice-channel", tc_name="text-channel", channel_type="public",
+                       text_members: List[discord.Member] = None, with_text=True, add_to_db=True) -> Tuple[
+                       discord.VoiceChannel, Union[discord.TextChannel, None]]:
     """
     Method to create a voice-channel with linked text-channel logging to DB included\n
     -> VCs created with this method are meant to be deleted later on, therefore they're logged to DB
@@ -27,32 +48,62 @@ async def make_channel(voice_state: discord.VoiceState, member: discord.Member,
     :param vc_name: Voice Channel name
     :param tc_name: Text Channel name
     :param channel_type: For SQL-logging can be "public" or "private"
+    :param text_members: Other members that will be moved into the VC and shall see the TC right away
+    :param with_text: False to create the VC only, the TC is created on demand later
+    :param add_to_db: False if the caller logs the channels itself, e.g. in one batch with other channels
 
-    :returns: Created Text and VoiceChannel Objects
+    :returns: Created Text and VoiceChannel Objects - the TC is None if with_text is False
     """
     # TODO handle error on creation - especially admin permission errors
     # if ctx.me.guild_permissions.administrator...
     
     # add bot to voice channel overwrites to ensure that bot can mange the channel
     bot_overwrites: Union[discord.PermissionOverwrite, None] = voice_overwrites.get(bot_member, None)
-    # check if some configurations for bot were made - update overwrites accordingly
+    # check if some configurations for bot were made - update a copy, overwrites may come from a shared template
     if bot_overwrites is not None:
+        bot_overwrites = discord.PermissionOverwrite.from_pair(*bot_overwrites.pair())
         bot_overwrites.update(view_channel=True, connect=True)
     else:
-        voice_overwrites[bot_member] = discord.PermissionOverwrite(view_channel=True, connect=True)
+        bot_overwrites = discord.PermissionOverwrite(view_channel=True, connect=True)
+    voice_overwrites = overwrite_templates.merge(voice_overwrites, {bot_member: bot_overwrites})
+
+    guild: discord.Guild = member.guild
+    route = ("channels", guild.id)
+
+    # complete overwrites right away - the bot's own moves into the channel don't update them
+    text_overwrites = text_channel_overwrites(guild, [member, *(text_members or [])], bot_member)
+
+    creations = [rest.run(Priority.MOVE, route, lambda: guild.create_voice_channel(
+        vc_name, category=voice_state.channel.category, overwrites=voice_overwrites))]
+
+    if with_text:
+        creations.append(rest.run(Priority.MOVE, route, lambda: guild.create_text_channel(
+            tc_name, category=voice_state.channel.category, overwrites=text_overwrites)))
 
-    # create channels
-    v_channel: discord.VoiceChannel = await member.guild.create_voice_channel(
-        vc_name, category=voice_state.channel.category, overwrites=voice_overwrites)
+    # create channels - both creations don't depend on each other, so they're issued at once
+    created = await asyncio.gather(*creations, return_exceptions=True)
 
-    t_channel: discord.TextChannel = await member.guild.create_text_channel(
-        tc_name, category=voice_state.channel.category,
-        overwrites={member: discord.PermissionOverwrite(view_channel=True),
-                    bot_member: discord.PermissionOverwrite(view_channel=True),
-                    member.guild.default_role: discord.PermissionOverwrite(view_channel=False)})
+    # one creation failed - remove the channel that was created, so nothing is left behind untracked
+    errors = [result for result in created if isinstance(result, BaseException)]
+    if errors:
+        for channel in created:
+            if isinstance(channel, discord.abc.GuildChannel):
+                try:
+                    await rest.run(Priority.DELETE, ("channel", channel.id),
+                                   lambda: channel.delete(reason="Creation of linked channel failed"))
+                except discord.HTTPException:
+                    pass
+        raise errors[0]
+
+    v_channel: discord.VoiceChannel = created[0]
+    t_channel: Union[discord.TextChannel, None] = created[1] if with_text else None
+    if t_channel:
+        activity_tracker.register(t_channel.id)
 
     # add channels to database
-    channels_db.add_channel(v_channel.id, t_channel.id, member.guild.id, channel_type, v_channel.category.id)
+    if add_to_db:
+        channels_db.add_channel(v_channel.id, t_channel.id if t_channel else None,
+                                member.guild.id, channel_type, v_channel.category.id)
 
     return v_channel, t_channel
 
@@ -64,6 +115,7 @@ def is_create_channel(guild: discord.Guild, channel: discord.VoiceChannel) -> bo
 tc_sign_prefix = "🔊-"  # shall be placed in {0} of text channel names, to highlight that channel is 'special'
 sign_public = "╠"       # shall be placed in {1} of public channel names, to highlight that channel is 'public'
 sign_private = "🔒"      # shall be placed in {1} of private channel names, to highlight that channel is 'private'
+unmoved_grace = 60      # seconds a created channel waits for its creator if the bot couldn't move them there
 channel_names = {"public_channel": [
                             # voice channel name, text channel name
                             ["{1}{0}'s discussion", "{0}-{1}'s discussion"],
@@ -93,14 +145,18 @@ channel_names = {"public_channel": [
 async def create_new_channels(member: discord.Member,
                               after: discord.VoiceState,
                               channel_type: str,
-                              bot_member: discord.Member) -> Tuple[discord.VoiceChannel, discord.TextChannel]:
+                              bot_member: discord.Member,
+                              use_pool=False,
+                              with_text=True) -> Tuple[discord.VoiceChannel, Union[discord.TextChannel, None]]:
     """
     :param member: member that issued the creation
     :param after: VoiceState that represents the state after the update
     :param channel_type: string that describes the type 'public_channel', 'private_channel'
     :param bot_member: needed to add bot itself to possibly hidden channel
+    :param use_pool: take a pre-created channel pair from the pool if one is ready
+    :param with_text: False if the linked text channel shall be created on demand - pooled pairs keep theirs
 
-    :returns: references to created voice and text channels
+    :returns: references to created voice and text channels, text channel is None if it wasn't created yet
     """
 
     # check if creator is allowed to rename a public channel
@@ -109,8 +165,9 @@ async def create_new_channels(member: discord.Member,
     # get channel names from dict above
     new_channel_name = random.choice(channel_names[channel_type])
 
-    # default overwrites for new channel
-    voice_channel_permissions = after.channel.category.overwrites
+    # default overwrites for new channel - cached, only the member specific overwrites are added
+    voice_channel_permissions = overwrite_templates.category_template(after.channel.category)
+    member_permissions = {}
 
     # overwriting permissions if channel shall be private
     is_private = channel_type == 'private_channel'
@@ -126,77 +183,122 @@ async def create_new_channels(member: discord.Member,
 
     # set extra permissions for creator if creators are allowed to edit public channels on this server
     elif allowed_to_edit and int(allowed_to_edit.value):
-        voice_channel_permissions[member] = discord.PermissionOverwrite(connect=True,
-                                                                        manage_channels=True)
+        member_permissions[member] = discord.PermissionOverwrite(connect=True,
+                                                                 manage_channels=True)
 
     # add bot to channel so the bot can see and manage this channel without administrator
-    voice_channel_permissions[bot_member] = discord.PermissionOverwrite(view_channel=True, connect=True)
+    member_permissions[bot_member] = discord.PermissionOverwrite(view_channel=True, connect=True)
+    voice_channel_permissions = overwrite_templates.merge(voice_channel_permissions, member_permissions)
+
+    vc_name = new_channel_name[0].format(member.display_name, sign_private if is_private else sign_public)
+    tc_name = new_channel_name[1].format(tc_sign_prefix, member.display_name)
+
+    # hand out a pooled pair - only a rename and a permission update is needed
+    voice_channel, text_channel = channel_pool.take(after.channel) if use_pool else (None, None)
+    if voice_channel:
+        edits = await asyncio.gather(
+            rest.run(Priority.MOVE, ("channel", voice_channel.id), lambda: voice_channel.edit(
+                name=vc_name, overwrites=voice_channel_permissions, reason=f"{member} issued creation")),
+            rest.run(Priority.MOVE, ("channel", text_channel.id), lambda: text_channel.edit(
+                name=tc_name, reason=f"{member} issued creation",
+                overwrites=text_channel_overwrites(member.guild, [member], bot_member))),
+            return_exceptions=True
+        )
+        errors = [edit for edit in edits if isinstance(edit, BaseException)]
+        if errors:
+            # a half edited pair can't go back into the pool - it's removed and fresh channels are created
+            logger.warning(f"Couldn't hand out pooled pair {voice_channel.id} on {member.guild.id}: {errors[0]}")
+            asyncio.create_task(channel_pool.discard(voice_channel, text_channel))
+            voice_channel, text_channel = None, None
+        else:
+            channels_db.set_internal_type(voice_channel.id, channel_type)
+            activity_tracker.register(text_channel.id)
 
     # issue creation of channels
-    voice_channel, text_channel = await make_channel(after, member, bot_member, voice_channel_permissions,
-                                                     vc_name=new_channel_name[0].format(
-                                                         member.display_name,
-                                                         sign_private if is_private else sign_public),
+    if voice_channel is None:
+        voice_channel, text_channel = await make_channel(after, member, bot_member, voice_channel_permissions,
+                                                         vc_name=vc_name, tc_name=tc_name, channel_type=channel_type,
+                                                         with_text=with_text)
 
-                                                     tc_name=new_channel_name[1].format(tc_sign_prefix,
-                                                                                        member.display_name),
-                                                     channel_type=channel_type)
+    # prepare the next pair off the critical path
+    if use_pool:
+        channel_pool.schedule_refill(after.channel, bot_member)
 
     return voice_channel, text_channel
 
 
+async def text_channel_has_messages(t_channel: discord.TextChannel, bot: commands.Bot) -> bool:
+    """ Check if there is more than the bots tutorial message in the channel """
+
+    # messages in this channel were tracked - no need to ask discord
+    tracked = activity_tracker.has_messages(t_channel.id, bot.user.id)
+    if tracked is not None:
+        return tracked
+
+    # get enough messages to check
+    messages: List[discord.Message] = await rest.run(Priority.DELETE, ("messages", t_channel.id),
+                                                     lambda: t_channel.history(limit=2).flatten())
+
+    # channel is empty
+    if len(messages) == 0:
+        return False
+
+    # only this bot has sent a message - probably the tutorial text -> assume empty
+    elif len(messages) == 1 and messages[0].author.id == bot.user.id:
+        return False
+
+    return True
+
+
 async def delete_text_channel(t_channel: discord.TextChannel, bot: commands.Bot,
-                              archive=None) -> Union[discord.TextChannel, None]:
+                              archive=None, has_messages: Union[bool, None] = None) \
+        -> Union[discord.TextChannel, None]:
     """
     Checks whether channel shall be archived or deleted and executes that action
 
+    :param has_messages: result of text_channel_has_messages if it's known already
+
     Returns edited channel or None if channel was deleted
     """
 
-    async def is_message_in_channel():
-        """ Check if there is more than the bots tutorial message in the channel """
-
-        # get enough messages to check
-        messages: List[discord.Message] = await t_channel.history(limit=2).flatten()
-
-        # channel is empty
-        if len(messages) == 0:
-            return False
-
-        # only this bot has sent a message - probably the tutorial text -> assume empty
-        elif len(messages) == 1 and messages[0].author.id == bot.user.id:
-            return False
+    if archive and has_messages is None:
+        has_messages = await text_channel_has_messages(t_channel, bot)
+    archive_channel = archive and has_messages
 
-        return True
+    # channel won't be linked anymore, whatever happens next
+    activity_tracker.forget(t_channel.id)
 
     # if archive is given and channel is not empty: move to archive
-    if archive and await is_message_in_channel():
+    if archive_channel:
 
-        await t_channel.edit(category=archive,
-                             reason="Connected voice channel is empty, archive channel with messages",
-                             overwrites=archive.overwrites)
+        await rest.run(Priority.DELETE, ("channel", t_channel.id), lambda: t_channel.edit(
+            category=archive, reason="Connected voice channel is empty, archive channel with messages",
+            overwrites=archive.overwrites))
         return t_channel
 
     # delete channel
-    await t_channel.delete(reason="Channel is empty and not needed anymore")
+    await rest.run(Priority.DELETE, ("channel", t_channel.id),
+                   lambda: t_channel.delete(reason="Channel is empty and not needed anymore"))
     return None
 
 
-async def clean_after_exception(voice_channel: discord.VoiceChannel, text_channel: discord.TextChannel,
+async def clean_after_exception(voice_channel: discord.VoiceChannel,
+                                text_channel: Union[discord.TextChannel, None],
                                 bot: commands.Bot,
                                 archive=None, log_channel=None):
     """ Cleanup routine that handles the deletion / activation of a voice- and text-channel"""
-    await voice_channel.delete(reason="An error occurred - user most likely left the channel during the process")
-    await delete_text_channel(text_channel, bot, archive=archive)
+    deletions = [rest.run(Priority.DELETE, ("channel", voice_channel.id), lambda: voice_channel.delete(
+        reason="An error occurred - user most likely left the channel during the process"))]
+    if text_channel:
+        deletions.append(delete_text_channel(text_channel, bot, archive=archive))
+
+    await asyncio.gather(*deletions)
     if log_channel:
-        log_channel.send(
-            embed=utl.make_embed(
-                name="Warning",
-                value="An error occurred - user most likely left the voice during the channels were set up.\n"
-                      "Cleanup finished.",
-                color=utl.orange
-            )
-        )
+        log_sink.post(log_channel,
+                      name="Warning",
+                      value="An error occurred - user most likely left the voice during the channels were set up.\n"
+                            "Cleanup finished.",
+                      color=utl.orange)
 
 
 def generate_text_channel_overwrite(
@@ -217,29 +319,34 @@ def generate_text_channel_overwrite(
     :returns: overwrites dictionary ready to apply
     """
 
-    guild: discord.Guild = voice_channel.guild
+    return text_channel_overwrites(voice_channel.guild, voice_channel.members, bot_member)
 
-    # get roles that have permissions to see all private TCs - like mods or bots
-    allowed_roles: List[db.Settings] = settings_db.get_all_settings_for(guild.id, "view_tc_role")
 
-    # roles that are allowed to see and write in channel by default
-    role_overwrites = {
-        guild.get_role(int(r.value)): discord.PermissionOverwrite(view_channel=True, send_messages=True)
-        for r in allowed_roles} if allowed_roles else {}
+def text_channel_overwrites(guild: discord.Guild, members: List[discord.Member], bot_member: discord.Member) \
+        -> Dict[Union[discord.Role, discord.Member], discord.PermissionOverwrite]:
+    """
+    Overwrites of a linked text channel that the given members shall access - see generate_text_channel_overwrite
+
+    :param guild: guild the channel is on
+    :param members: members that are or will be in the voice channel
+    :param bot_member: needed to add bot itself to hidden channel
+
+    :returns: overwrites dictionary ready to apply
+    """
 
-    # exclude default role to make channel private
-    role_overwrites[guild.default_role] = discord.PermissionOverwrite(view_channel=False)
+    # roles that may see all linked TCs - like mods or bots - and the hidden default role, built once per guild
+    role_overwrites = overwrite_templates.text_template(guild)
 
-    # overwrites that contain permissions for all member currently in the voice channel
+    # overwrites that contain permissions for all given members
     member_overwrites = {
-        m: discord.PermissionOverwrite(view_channel=True, send_messages=True) for m in voice_channel.members
+        m: discord.PermissionOverwrite(view_channel=True, send_messages=True) for m in members
     }
 
     # add bot user self to channel, so bot can access the channel at any time
     member_overwrites[bot_member] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
 
     # return joined dicts
-    return {**role_overwrites, **member_overwrites}
+    return overwrite_templates.merge(role_overwrites, member_overwrites)
 
 
 async def update_channel_overwrites(after_channel: discord.VoiceChannel,
@@ -250,11 +357,29 @@ async def update_channel_overwrites(after_channel: discord.VoiceChannel,
     linked_channel: discord.TextChannel = after_channel.guild.get_channel(created_channel.text_channel_id)
     # TODO: logging if text channel not exists
     if linked_channel:
-        await linked_channel.edit(overwrites=overwrites)
+        await rest.run(Priority.PERMISSION, ("channel", linked_channel.id),
+                       lambda: linked_channel.edit(overwrites=overwrites))
+
+
+def has_access_drift(actual: Dict[Union[discord.Role, discord.Member], discord.PermissionOverwrite],
+                     wanted: Dict[Union[discord.Role, discord.Member], discord.PermissionOverwrite]) -> bool:
+    """
+    Check if the overwrites of a channel grant access to other roles / members than wanted\n
+    Only the view permission is compared, targets that don't exist anymore are ignored
+
+    :param actual: overwrites the channel has
+    :param wanted: overwrites the channel should have
+
+    :returns: True if they differ
+    """
+    def access(overwrites):
+        return {target.id: overwrite.view_channel for target, overwrite in overwrites.items() if target is not None}
+
+    return access(actual) != access(wanted)
 
 
 async def send_welcome_message(text_channel: discord.TextChannel, linked_vc: discord.VoiceChannel):
-    await text_channel.send(
+    await rest.run(Priority.MESSAGE, ("messages", text_channel.id), lambda: text_channel.send(
         embed=utl.make_embed(
             name='Welcome to your own private channel!',
             value=f'Hey, this channel is only visible for people that are in your voice chat:\n'
@@ -266,7 +391,123 @@ async def send_welcome_message(text_channel: discord.TextChannel, linked_vc: dis
                    'when everyone has left the affiliated voice channel.',
             color=utl.green
         )
-    )
+    ))
+
+
+# what happens to the linked text channel of a static channel when the voice channel is empty
+# recreate: archive or delete it, a new one is created on the next join
+# keep: hide it and reveal it on the next join, purge: hide it and delete its messages
+# export: like purge, but the messages are sent to the log channel as a file first
+static_text_modes = ("recreate", "keep", "purge", "export")
+
+
+def get_static_text_mode(guild_id: int, session) -> str:
+    """ Get the way linked text channels of static channels are handled when the voice channel is empty """
+    entry = settings_db.get_first_setting_for(guild_id, "static_text_mode", session)
+    return entry.value if entry else "recreate"
+
+
+async def export_messages(text_channel: discord.TextChannel, log_channel: discord.TextChannel) -> bool:
+    """
+    Send all messages of a text channel as a text file to the log channel\n
+    Messages are written to the file while the history is fetched - only the transcript is kept in memory
+
+    :returns: True if the export was sent or there was nothing to export,
+              False if it failed or the channel has more than EXPORT_MESSAGE_LIMIT messages
+    """
+    transcript = io.BytesIO()
+
+    async def write_history() -> int:
+        count = 0
+        # one more than the limit, to know if the channel has too many messages
+        async for m in text_channel.history(limit=EXPORT_MESSAGE_LIMIT + 1, oldest_first=True):
+            count += 1
+            if count > EXPORT_MESSAGE_LIMIT:
+                break
+            transcript.write(f"[{m.created_at:%Y-%m-%d %H:%M}] {m.author}: {m.clean_content}\n".encode())
+        return count
+
+    try:
+        count = await rest.run(Priority.BACKGROUND, ("messages", text_channel.id), write_history)
+
+        if not count:
+            return True
+
+        # an incomplete export must not be followed by a purge
+        if count > EXPORT_MESSAGE_LIMIT:
+            logger.info(f"Didn't export {text_channel.id}, it has more than {EXPORT_MESSAGE_LIMIT} messages")
+            return False
+
+        transcript.seek(0)
+        await rest.run(Priority.BACKGROUND, ("messages", log_channel.id), lambda: log_channel.send(
+            f"Messages of {text_channel.mention}",
+            file=discord.File(transcript, filename=f"{text_channel.name}.txt")))
+        return True
+    except discord.HTTPException as e:
+        logger.warning(f"Couldn't export messages of {text_channel.id}: {e}")
+        return False
+
+
+async def hide_text_channel(text_channel: discord.TextChannel, bot_member: discord.Member, mode: str,
+                            log_channel: Union[discord.TextChannel, None]):
+    """
+    Hide the linked text channel of an empty static channel, so it can be revealed on the next join
+
+    :param text_channel: channel to hide
+    :param bot_member: bot as member, keeps access to the channel
+    :param mode: one of static_text_modes except 'recreate'
+    :param log_channel: log channel if configured - needed for mode 'export'
+    """
+    await rest.run(Priority.DELETE, ("channel", text_channel.id), lambda: text_channel.edit(
+        overwrites={text_channel.guild.default_role: discord.PermissionOverwrite(view_channel=False),
+                    bot_member: discord.PermissionOverwrite(view_channel=True, send_messages=True)},
+        reason="Connected voice channel is empty, hide channel"))
+
+    # nothing to remove if nobody wrote in the channel
+    if mode == "keep" or activity_tracker.has_messages(text_channel.id, bot_member.id) is False:
+        return
+
+    # messages are kept if they can't be exported
+    if mode == "export" and not (log_channel and await export_messages(text_channel, log_channel)):
+        return
+
+    # purge takes no audit log reason in discord.py 1.5
+    try:
+        await rest.run(Priority.BACKGROUND, ("messages", text_channel.id), lambda: text_channel.purge(limit=None))
+    except discord.HTTPException as e:
+        logger.warning(f"Couldn't purge hidden text channel {text_channel.id}: {e}")
+        return
+
+    activity_tracker.forget(text_channel.id)
+    activity_tracker.register(text_channel.id)
+
+
+def get_lazy_text_threshold(guild_id: int, session) -> int:
+    """
+    Get the amount of members a voice channel needs before its linked text channel is created
+
+    :returns: 0 if text channels are created right away, else the member threshold
+    """
+    entry = settings_db.get_first_setting_for(guild_id, "lazy_text_channel", session)
+    return int(entry.value) if entry else 0
+
+
+def get_log_and_archive(guild: discord.Guild, session) -> Tuple[Union[discord.TextChannel, None],
+                                                                Union[discord.CategoryChannel, None]]:
+    """
+    Get log channel and archive category of a guild if they're configured
+
+    :returns: log channel, archive category - each None if not set
+    """
+    log_entry = settings_db.get_first_setting_for(guild.id, "log_channel", session)  # get entry if exists
+    archive_entry = settings_db.get_first_setting_for(guild.id, "archive_category", session)
+
+    # get channels from entries if existing
+    log_channel: Union[discord.TextChannel, None] = guild.get_channel(int(log_entry.value)) if log_entry else None
+    archive_category: Union[discord.CategoryChannel, None] = guild.get_channel(
+        int(archive_entry.value)) if archive_entry else None
+
+    return log_channel, archive_category
 
 
 class VCCreator(commands.Cog):
@@ -281,6 +522,579 @@ class VCCreator(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.pending_tear_downs: Dict[int, asyncio.Task] = {}  # voice channel id: delayed removal
+        self.text_creations: Set[int] = set()  # voice channel ids whose linked text channel is being created
+
+        # statistics of the permission reconciler
+        self.reconcile_stats = {"runs": 0, "checked": 0, "repaired": 0, "last_run_seconds": 0}
+        metrics.register("permission reconciler", lambda guild_id: self.reconcile_stats)
+        self.reconcile_overwrites.start()
+
+    def cog_unload(self):
+        self.reconcile_overwrites.cancel()
+
+    async def cog_before_invoke(self, ctx: commands.Context):
+        if ctx.guild:
+            await guild_scheduler.acquire(ctx.guild.id)
+
+    async def cog_after_invoke(self, ctx: commands.Context):
+        if ctx.guild:
+            guild_scheduler.release(ctx.guild.id)
+
+    @tasks.loop(seconds=RECONCILE_INTERVAL)
+    async def reconcile_overwrites(self):
+        """
+        Repair linked text channels whose overwrites don't match the members in their voice channel\n
+        This happens when voice events were missed, e.g. during reconnects
+        """
+        start = time.monotonic()
+        # own session per run - the default session would return the entries of the first run over and over
+        session = db.open_session()
+        try:
+            await self._reconcile(session)
+        finally:
+            session.close()
+
+        self.reconcile_stats["runs"] += 1
+        self.reconcile_stats["last_run_seconds"] = round(time.monotonic() - start, 2)
+
+    async def _reconcile(self, session):
+        for guild in self.bot.guilds:
+            bot_member = guild.get_member(self.bot.user.id)
+
+            for entry in channels_db.get_channels_by_guild(guild.id, session):
+                voice_channel = guild.get_channel(entry.voice_channel_id)
+                text_channel = guild.get_channel(entry.text_channel_id) if entry.text_channel_id else None
+
+                # empty channels are handled by the teardown, pooled channels are hidden on purpose
+                if voice_channel is None or text_channel is None or not voice_channel.members \
+                        or entry.internal_type == pool_type:
+                    continue
+
+                self.reconcile_stats["checked"] += 1
+                wanted = generate_text_channel_overwrite(voice_channel, bot_member)
+                if not has_access_drift(text_channel.overwrites, wanted):
+                    continue
+
+                try:
+                    await rest.run(Priority.BACKGROUND, ("channel", text_channel.id), lambda: text_channel.edit(
+                        overwrites=wanted, reason="Repaired permissions of linked text channel"))
+                    self.reconcile_stats["repaired"] += 1
+                except discord.HTTPException as e:
+                    logger.warning(f"Couldn't repair overwrites of {text_channel.id} on {guild.id}: {e}")
+
+                # don't spend the rate limits members are waiting for
+                await asyncio.sleep(RECONCILE_PACE)
+
+    @reconcile_overwrites.before_loop
+    async def before_reconcile(self):
+        await self.bot.wait_until_ready()
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        # new channels are based on the overwrites of their category
+        if isinstance(after, discord.CategoryChannel):
+            overwrite_templates.invalidate_category(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        if isinstance(channel, discord.CategoryChannel):
+            overwrite_templates.invalidate_category(channel.id)
+
+        # late events for this channel must not try to remove it again
+        elif isinstance(channel, discord.VoiceChannel):
+            voice_events.mark_deleted(channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        overwrite_templates.invalidate_guild(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        overwrite_templates.invalidate_guild(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        for guild in self.bot.guilds:
+            # pooled channels from a previous run are not known to the pool anymore
+            await clean_up_pooled_channels(guild)
+            async with guild_scheduler.slot(guild.id):
+                await self.sweep_empty_channels(guild)
+
+    async def sweep_empty_channels(self, guild: discord.Guild):
+        """
+        Remove managed channels that are empty without a teardown pending\n
+        Channels emptied while the bot was offline or during a grace period before a restart get no further
+        voice event - the reconciler skips empty channels, so they'd stay forever
+        """
+        session = db.open_session()
+        log_channel, archive_category = get_log_and_archive(guild, session)
+
+        for entry in channels_db.get_channels_by_guild(guild.id, session):
+            voice_channel = guild.get_channel(entry.voice_channel_id)
+            if voice_channel is None or voice_channel.members or entry.voice_channel_id in self.pending_tear_downs:
+                continue
+
+            # pooled channels are empty on purpose, kept rooms wait for the next round
+            # static channels only lose their linked text channel, if they still have one
+            if entry.internal_type == pool_type \
+                    or (entry.internal_type == "breakout_room"
+                        and breakout_sessions.is_kept_room(guild.id, voice_channel.id)) \
+                    or (entry.internal_type == "static_channel" and not entry.text_channel_id):
+                continue
+
+            try:
+                await self.tear_down(voice_channel, entry, session, log_channel, archive_category)
+            except discord.HTTPException as e:
+                logger.warning(f"Couldn't remove empty channel {voice_channel.id} on {guild.id}: {e}")
+
+        session.commit()
+        session.close()
+
+    async def create_channels_for(self, member: discord.Member, after: discord.VoiceState, channel_type: str,
+                                  bot_member_on_guild: discord.Member, session,
+                                  log_channel: Union[discord.TextChannel, None],
+                                  archive_category: Union[discord.CategoryChannel, None]):
+        """
+        Create a new channel pair for a member that joined a tracked channel and move the member there
+
+        :param member: member that joined the tracked channel
+        :param after: voice state after the join
+        :param channel_type: setting of the tracked channel like 'public_channel'
+        :param bot_member_on_guild: bot as member, needs access to the created channels
+        :param session: session of the running event
+        :param log_channel: log channel if configured
+        :param archive_category: archive category if configured
+        """
+        guild: discord.Guild = member.guild
+
+        # member might have left while the creation was queued
+        if member.voice is None or member.voice.channel != after.channel:
+            return
+
+        pool_entry = settings_db.get_first_setting_for(guild.id, "channel_pool", session)
+        voice_channel, text_channel = await create_new_channels(member, after,
+                                                                channel_type, bot_member_on_guild,
+                                                                use_pool=bool(pool_entry and
+                                                                              int(pool_entry.value)),
+                                                                with_text=not get_lazy_text_threshold(guild.id,
+                                                                                                      session))
+
+        # write to log channel if configured - delivered in the background
+        if log_channel:
+            log_sink.post(log_channel,
+                          name="Created voice channel",
+                          value=f"{member.mention} created "
+                                f"`{voice_channel.name if voice_channel else '`deleted`'}` "
+                                f"with {text_channel.mention if text_channel else 'no text channel yet'}")
+
+        # the text channel was created with the right overwrites - the move doesn't need to update them
+        expected_moves.expect(member, voice_channel)
+
+        # moving creator and explaining the text channel only depend on the created channels
+        # moves are limited per member like bulk moves - a join storm doesn't push them past their deadline
+        moved, *others = await asyncio.gather(
+            rest.run(Priority.MOVE, ("move", member.id),
+                     lambda: member.move_to(voice_channel, reason=f'{member} issued creation')),
+            *([send_welcome_message(text_channel, voice_channel)] if text_channel else []),
+            return_exceptions=True
+        )
+
+        for error in others:
+            if isinstance(error, Exception):
+                logger.warning(f"Error after creation of {voice_channel.id} on {guild.id}: {error}")
+
+        # a timed out move might have gone through anyway
+        if isinstance(moved, rest.RestUnavailable) and member.voice and member.voice.channel == voice_channel:
+            moved = None
+
+        # the move wasn't made in time - the member is still waiting in the trigger channel, try once more
+        if isinstance(moved, rest.RestUnavailable) and member.voice and member.voice.channel == after.channel:
+            try:
+                await rest.run(Priority.MOVE, ("move", member.id),
+                               lambda: member.move_to(voice_channel, reason=f'{member} issued creation'))
+                moved = None
+            except discord.HTTPException as e:
+                moved = e
+
+        # the member stays where they are - the empty channel is removed unless they join it in the meantime
+        if isinstance(moved, rest.RestUnavailable) and member.voice:
+            logger.warning(f"Couldn't move {member.id} to created channel {voice_channel.id} on {guild.id}: {moved}")
+            expected_moves.discard(member)
+            admission.remember(guild.id, member.id, voice_channel.id)
+            self.schedule_tear_down(voice_channel, unmoved_grace)
+
+        # if user already left already
+        elif isinstance(moved, discord.HTTPException):
+            print("Handle HTTP exception during creation of channels - channel was already empty")
+            expected_moves.discard(member)
+            await clean_after_exception(voice_channel, text_channel, self.bot,
+                                        archive=archive_category, log_channel=log_channel)
+
+        elif isinstance(moved, BaseException):
+            raise moved
+
+        else:
+            admission.remember(guild.id, member.id, voice_channel.id)
+
+    async def create_linked_text_channel(self, voice_channel: discord.VoiceChannel,
+                                         created_channel: db.CreatedChannels, session,
+                                         reason="User joined linked voice channel") -> Union[discord.TextChannel, None]:
+        """
+        Create the linked text channel of a voice channel that has none - static channels after they were empty
+        or channels whose text channel is created on demand
+
+        :param voice_channel: voice channel the text channel is linked to
+        :param created_channel: database entry of that channel, must belong to the given session
+        :param session: session to update the entry with
+        :param reason: reason shown in the audit log
+
+        :returns: the created channel, None if creation failed or is already running
+        """
+        # two joins at once shall not create two text channels
+        if voice_channel.id in self.text_creations:
+            return None
+
+        self.text_creations.add(voice_channel.id)
+        try:
+            tc_overwrite = generate_text_channel_overwrite(voice_channel, self.bot.user)
+            tc_name = voice_channel.name.lstrip(sign_public + sign_private)
+            text_channel = await rest.run(
+                Priority.MOVE, ("channels", voice_channel.guild.id),
+                lambda: voice_channel.guild.create_text_channel(f"{tc_sign_prefix}{tc_name}",
+                                                                overwrites=tc_overwrite,
+                                                                category=voice_channel.category,
+                                                                reason=reason))
+        except discord.HTTPException as e:
+            logger.warning(f"Couldn't create linked text channel for {voice_channel.id}: {e}")
+            return None
+
+        finally:
+            self.text_creations.discard(voice_channel.id)
+
+        created_channel.text_channel_id = text_channel.id
+        activity_tracker.register(text_channel.id)
+        session.add(created_channel)
+        session.flush()
+
+        await send_welcome_message(text_channel, voice_channel)  # send message explaining text channel
+        return text_channel
+
+    @commands.command(name="text", aliases=["tc", "text-channel"],
+                      help=f"""
+                            Usage: `{PREFIX}text`\n
+                            Creates the linked text channel of the voice channel you're in\n
+                            Only needed if your server creates text channels on demand, \
+                            see `{PREFIX}help set` - setting _lazy_\n
+                            Alias: `tc`, `text-channel`
+                            """)
+    async def open_text_channel(self, ctx: commands.Context):
+        voice_channel = ctx.author.voice.channel if ctx.author.voice else None
+        session = db.open_session()
+        created_channel = channels_db.get_voice_channel_by_id(voice_channel.id, session) if voice_channel else None
+
+        if created_channel is None or created_channel.internal_type == pool_type:
+            await hp.send_embed(ctx, embed=utl.make_embed(
+                name="You're not in a channel created by me",
+                value="Please join a channel created by me and try again",
+                color=utl.orange))
+
+        elif created_channel.text_channel_id and ctx.guild.get_channel(created_channel.text_channel_id):
+            await hp.send_embed(ctx, embed=utl.make_embed(
+                name="There is a text channel already",
+                value=f"Your channel is linked to {ctx.guild.get_channel(created_channel.text_channel_id).mention}",
+                color=utl.blue_light))
+
+        else:
+            text_channel = await self.create_linked_text_channel(voice_channel, created_channel, session,
+                                                                 reason=f"{ctx.author} requested text channel")
+            if text_channel:
+                await hp.send_embed(ctx, embed=utl.make_embed(
+                    name="Created text channel",
+                    value=f"{text_channel.mention} is linked to your voice channel",
+                    color=utl.green))
+
+        session.commit()
+        session.close()
+
+    async def handle_overflow(self, member: discord.Member, policy: str, verdict: Verdict):
+        """
+        Handle a member whose creation wasn't admitted
+
+        :param member: member that joined a tracked channel
+        :param policy: 'reuse' moves the member to the last channel created for them, everything else rejects
+        :param verdict: reason the creation wasn't admitted, the member is told about it
+        """
+        guild: discord.Guild = member.guild
+
+        if policy == "reuse":
+            last_channel = guild.get_channel(admission.last_channel(guild.id, member.id))
+            if last_channel:
+                try:
+                    await rest.run(Priority.MOVE, ("move", member.id),
+                                   lambda: member.move_to(last_channel, reason="Reused channel, creation limit reached"))
+                    return
+                except discord.HTTPException:
+                    pass
+
+        if verdict == Verdict.MEMBER_LIMIT:
+            reason = f"You created a lot of channels on {guild.name} lately, so I can't create another one yet."
+        else:
+            reason = f"There are too many new channels on {guild.name} right now, so I can't create one for you."
+
+        try:
+            await rest.run(Priority.MESSAGE, ("dm", member.id), lambda: member.send(embed=utl.make_embed(
+                name="Please wait a moment",
+                value=f"{reason}\n"
+                      "Please rejoin the channel in a moment.",
+                color=utl.yellow
+            )))
+        except discord.HTTPException:
+            pass
+
+    async def tear_down(self, voice_channel: discord.VoiceChannel, created_channel: db.CreatedChannels, session,
+                        log_channel: Union[discord.TextChannel, None],
+                        archive_category: Union[discord.CategoryChannel, None]):
+        """
+        Remove an empty channel created by the bot - static channels only lose their linked text channel\n
+        Does nothing if the channel is already being removed, e.g. because an event was delivered twice
+
+        :param voice_channel: the empty voice channel
+        :param created_channel: database entry of that channel, must belong to the given session
+        :param session: session to update the entry with
+        :param log_channel: log channel if configured
+        :param archive_category: archive category if configured
+        """
+        if not voice_events.begin_deletion(voice_channel.id):
+            return
+
+        try:
+            await self._tear_down(voice_channel, created_channel, session, log_channel, archive_category)
+        except Exception:
+            voice_events.finish_deletion(voice_channel.id, deleted=False)
+            raise
+
+        voice_events.finish_deletion(voice_channel.id, deleted=created_channel.internal_type != 'static_channel')
+
+    async def _tear_down(self, voice_channel: discord.VoiceChannel, created_channel: db.CreatedChannels, session,
+                         log_channel: Union[discord.TextChannel, None],
+                         archive_category: Union[discord.CategoryChannel, None]):
+        # fetch needed information
+        voice_channel_id: int = voice_channel.id  # extract id before deleting, needed for db deletion
+        text_channel: Union[discord.TextChannel, None] = voice_channel.guild.get_channel(created_channel.text_channel_id)
+
+        # linked text channels of static channels can be kept - they're revealed again on the next join
+        if created_channel.internal_type == 'static_channel' and text_channel:
+            mode = get_static_text_mode(voice_channel.guild.id, session)
+            if mode != "recreate":
+                try:
+                    await hide_text_channel(text_channel, voice_channel.guild.get_member(self.bot.user.id),
+                                            mode, log_channel)
+                except discord.HTTPException as e:
+                    logger.warning(f"Couldn't hide linked text channel {text_channel.id}: {e}")
+
+                if log_channel:
+                    log_sink.post(log_channel,
+                                  name=f"Hid {text_channel.name}",
+                                  value=f"{text_channel.mention} is linked to {voice_channel.name}, "
+                                        f"it's revealed again when a member joins")
+                return
+
+        # delete channels - catch AttributeErrors to still do the db access and the logging
+
+        # delete VC only if it's not a static_channel
+        if created_channel.internal_type != 'static_channel':
+            try:
+                await rest.run(Priority.DELETE, ("channel", voice_channel.id),
+                               lambda: voice_channel.delete(reason="Channel is empty"))
+            except AttributeError:
+                pass
+
+        # archive or delete linked text channel
+        try:
+            archived_channel = await delete_text_channel(text_channel, self.bot, archive=archive_category) \
+                if text_channel else None
+
+        except AttributeError:
+            archived_channel = None
+
+        except discord.errors.HTTPException:
+            # occurs when category that the channel shall be moved to is full
+            archived_channel = None
+            if log_channel:
+                log_sink.post(
+                    log_channel,
+                    name="ERROR handling linked text channel",
+                    value=f"This error probably means that the archive `{archive_category.mention}` is full.\n"
+                          "Please check the category and it and set a new one or delete older channels.\n"
+                          "Text channel was not deleted",
+                    color=utl.red)
+
+        # static channels without text channel had nothing to remove
+        if log_channel and text_channel is None and created_channel.internal_type != 'static_channel':
+            log_sink.post(log_channel,
+                          name=f"Deleted {voice_channel.name}",
+                          value="The channel had no linked text channel")
+
+        elif log_channel and text_channel:
+            static = True if created_channel.internal_type == 'static_channel' else False  # helper variable
+
+            log_sink.post(
+                log_channel,
+                name=f"Removed {text_channel.name}" if static else f"Deleted {voice_channel.name}",
+                value=f"{text_channel.mention} was linked to {voice_channel.name} and is " if static
+                      else f"The linked text channel {text_channel.mention} is "
+                      f"{'moved to archive' if archived_channel is not None and archive_category else 'deleted'}"
+            )
+
+        if created_channel.internal_type == 'static_channel':
+            # remove reference to now archived channel
+            created_channel.text_channel_id = None
+            session.add(created_channel)
+            session.flush()
+
+        else:
+            # remove deleted channel from database
+            channels_db.del_channel(voice_channel_id)
+            admission.forget_channel(voice_channel_id)
+            if created_channel.internal_type == "breakout_room":
+                breakout_sessions.discard_room(voice_channel.guild.id, voice_channel_id)
+
+    async def bulk_tear_down(self, guild: discord.Guild, voice_channels: List[discord.VoiceChannel],
+                             claimed=False, gone: Set[int] = frozenset()):
+        """
+        Remove many breakout rooms at once, e.g. when a session is closed\n
+        Archive or delete is decided for all rooms first, rooms are removed concurrently, their entries
+        are deleted with one statement and one summary is logged
+
+        :param guild: guild the rooms are on
+        :param voice_channels: rooms to remove
+        :param claimed: deletion of the rooms was begun by the caller already - their voice events are skipped
+        :param gone: ids of members that were moved out, but may still be listed as members of a room
+        """
+        if not claimed:
+            voice_channels = [vc for vc in voice_channels if voice_events.begin_deletion(vc.id)]
+
+        # members that couldn't be moved out keep their room - it's removed when they leave
+        rooms = []
+        for voice_channel in voice_channels:
+            self.cancel_tear_down(voice_channel.id)
+            if any(member.id not in gone for member in voice_channel.members):
+                voice_events.finish_deletion(voice_channel.id, deleted=False)
+            else:
+                rooms.append(voice_channel)
+
+        if not rooms:
+            return
+
+        session = db.open_session()
+        log_channel, archive_category = get_log_and_archive(guild, session)
+        entries = {entry.voice_channel_id: entry
+                   for entry in channels_db.get_channels_by_ids([room.id for room in rooms], session)}
+        session.close()
+
+        text_channels = [guild.get_channel(entries[room.id].text_channel_id)
+                         if room.id in entries and entries[room.id].text_channel_id else None
+                         for room in rooms]
+
+        # decide archive or delete for all rooms at once - mostly answered by the activity tracker
+        async def has_messages(text_channel: Union[discord.TextChannel, None]) -> bool:
+            if text_channel is None or archive_category is None:
+                return False
+            try:
+                return await text_channel_has_messages(text_channel, self.bot)
+            except discord.HTTPException:
+                return False
+
+        archive = await asyncio.gather(*(has_messages(text_channel) for text_channel in text_channels))
+
+        limit = asyncio.Semaphore(BREAKOUT_REMOVAL_CONCURRENCY)
+        removed, archived, failed = [], [], []
+
+        async def remove(room: discord.VoiceChannel, text_channel: Union[discord.TextChannel, None],
+                         archive_it: bool):
+            async with limit:
+                try:
+                    await rest.run(Priority.DELETE, ("channel", room.id),
+                                   lambda: room.delete(reason="Breakout rooms closed"))
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException as e:
+                    failed.append((room.name, e.text or str(e.status)))
+                    voice_events.finish_deletion(room.id, deleted=False)
+                    return
+
+                removed.append(room.id)
+                voice_events.finish_deletion(room.id, deleted=True)
+
+                if text_channel is None:
+                    return
+                try:
+                    await delete_text_channel(text_channel, self.bot,
+                                              archive=archive_category if archive_it else None,
+                                              has_messages=archive_it)
+                    if archive_it:
+                        archived.append(text_channel)
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException as e:
+                    # archive is probably full - the text channel stays where it is
+                    failed.append((text_channel.name, e.text or str(e.status)))
+
+        await asyncio.gather(*(remove(room, text_channel, archive_it)
+                               for room, text_channel, archive_it in zip(rooms, text_channels, archive)))
+
+        channels_db.del_channels(removed)
+        for voice_channel_id in removed:
+            admission.forget_channel(voice_channel_id)
+            breakout_sessions.discard_room(guild.id, voice_channel_id)
+
+        if log_channel:
+            value = f"{len(removed)} rooms were removed"
+            if archived:
+                value += f", {len(archived)} linked text channels with messages were moved to {archive_category.mention}"
+            if failed:
+                value += f"\nCouldn't remove {len(failed)} channels:\n" + \
+                         "\n".join(f"{name}: {reason}" for name, reason in failed[:10])
+            log_sink.post(log_channel, name="Closed breakout rooms", value=value,
+                          color=utl.red if failed else utl.green)
+
+    def schedule_tear_down(self, voice_channel: discord.VoiceChannel, grace: int):
+        """ Remove an empty channel after grace seconds, unless a member joins it again """
+        self.cancel_tear_down(voice_channel.id)
+        self.pending_tear_downs[voice_channel.id] = asyncio.create_task(
+            self._tear_down_later(voice_channel, grace))
+
+    def cancel_tear_down(self, voice_channel_id: int) -> bool:
+        """ Stop a scheduled removal, returns True if there was one """
+        task = self.pending_tear_downs.pop(voice_channel_id, None)
+        if task and not task.done():
+            task.cancel()
+            return True
+        return False
+
+    async def _tear_down_later(self, voice_channel: discord.VoiceChannel, grace: int):
+        await asyncio.sleep(grace)
+        self.pending_tear_downs.pop(voice_channel.id, None)
+
+        # somebody came back in the meantime
+        if voice_channel.members:
+            return
+
+        # nobody awaits this task - errors are logged here and the session is always finished
+        session = db.open_session()
+        try:
+            created_channel = channels_db.get_voice_channel_by_id(voice_channel.id, session)
+            if created_channel:
+                log_channel, archive_category = get_log_and_archive(voice_channel.guild, session)
+                await self.tear_down(voice_channel, created_channel, session, log_channel, archive_category)
+        except discord.HTTPException as e:
+            logger.warning(f"Couldn't remove empty channel {voice_channel.id} on {voice_channel.guild.id}: {e}")
+        except Exception as e:
+            logger.error(f"Delayed removal of {voice_channel.id} on {voice_channel.guild.id} failed: {e}")
+        finally:
+            session.commit()
+            session.close()
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState,
@@ -290,6 +1104,78 @@ class VCCreator(commands.Cog):
         if before.channel and after.channel and before.channel.id == after.channel.id:
             return
 
+        # most events happen in channels the bot doesn't care about - reject them without touching the database
+        if not channel_index.is_interesting(member.guild.id,
+                                            before.channel.id if before.channel else None,
+                                            after.channel.id if after.channel else None):
+            return
+
+        # events can be delivered again after a reconnect - they were handled already
+        if voice_events.is_duplicate(member, before, after):
+            return
+
+        # the bot moved this member itself, the initiator of the move takes care of the text channel overwrites
+        expected = expected_moves.consume(member, after.channel)
+
+        # check if joined (after) channel is a channel that triggers a channel creation
+        creation_type = None
+        if after.channel:
+            session = db.open_session()
+            tracked_channel = settings_db.get_setting_by_value(member.guild.id, after.channel.id, session)
+            creation_type = tracked_channel.setting if tracked_channel else None
+            session.close()
+
+        # busy guilds must not keep the other guilds waiting
+        async with guild_scheduler.slot(member.guild.id):
+            await self.handle_voice_state_update(member, before, after, expected, creation_type)
+
+        # creations wait for admission without a slot - leave and teardown events of the guild keep running
+        if creation_type:
+            await self.admit_creation(member, after, creation_type)
+
+    async def admit_creation(self, member: discord.Member, after: discord.VoiceState, channel_type: str):
+        """
+        Create channels for a member that joined a trigger channel if admission control lets the creation through\n
+        The admission control limits the creations of a guild itself and can wait up to CREATION_MAX_WAIT,
+        so this runs outside of the guild slots
+
+        :param member: member that joined the trigger channel
+        :param after: voice state after the join
+        :param channel_type: setting of the trigger channel like 'public_channel'
+        """
+        guild: discord.Guild = member.guild
+        session = db.open_session()
+
+        overflow_entry = settings_db.get_first_setting_for(guild.id, "creation_overflow", session)
+        overflow_policy = overflow_entry.value if overflow_entry else "wait"
+
+        # protect the guild against join storms - too many creations at once or by the same member
+        verdict = await admission.admit(guild.id, member.id, wait=overflow_policy == "wait")
+        if verdict == Verdict.ADMITTED:
+            async with admission.creation(guild.id):
+                log_channel, archive_category = get_log_and_archive(guild, session)
+                await self.create_channels_for(member, after, channel_type, guild.get_member(self.bot.user.id),
+                                               session, log_channel, archive_category)
+
+        else:
+            await self.handle_overflow(member, overflow_policy, verdict)
+
+        session.commit()
+        session.close()
+
+    async def handle_voice_state_update(self, member: discord.Member, before: discord.VoiceState,
+                                        after: discord.VoiceState, expected: bool,
+                                        creation_type: Union[str, None] = None):
+        """
+        Update or remove channels after a member switched channels - creations are run by admit_creation
+
+        :param member: member of the event
+        :param before: voice state before the switch
+        :param after: voice state after the switch
+        :param expected: True if the bot moved the member itself
+        :param creation_type: type of the trigger channel the member joined, None if it's no trigger channel
+        """
+
         # as shorthand - we'll need this a few times
         guild: discord.Guild = member.guild
         bot_member_on_guild: discord.Member = guild.get_member(self.bot.user.id)
@@ -300,13 +1186,7 @@ class VCCreator(commands.Cog):
         session = db.open_session()
 
         # get settings for archive and log channel
-        log_entry = settings_db.get_first_setting_for(guild.id, "log_channel", session)  # get entry if exists
-        archive_entry = settings_db.get_first_setting_for(guild.id, "archive_category", session)
-
-        # get channels from entries if existing
-        log_channel: Union[discord.TextChannel, None] = guild.get_channel(int(log_entry.value)) if log_entry else None
-        archive_category: Union[discord.CategoryChannel, None] = guild.get_channel(
-            int(archive_entry.value)) if archive_entry else None
+        log_channel, archive_category = get_log_and_archive(guild, session)
 
         # check if member has a voice channel after the state update
         # could trigger the creation of a new channel or require an update for an existing one
@@ -315,61 +1195,38 @@ class VCCreator(commands.Cog):
             # check db if channel is a channel that was created by the bot
             created_channel: Union[db.CreatedChannels, None] = channels_db.get_voice_channel_by_id(after_channel.id, session)
 
-            # check if joined (after) channel is a channel that triggers a channel creation
-            tracked_channel = settings_db.get_setting_by_value(guild.id, after_channel.id, session)
-
-            if tracked_channel:
-                voice_channel, text_channel = await create_new_channels(member, after,
-                                                                        tracked_channel.setting, bot_member_on_guild)
-
-                # write to log channel if configured
-                if log_entry:
-                    await log_channel.send(
-                        embed=utl.make_embed(
-                            name="Created voice channel",
-                            value=f"{member.mention} created `{voice_channel.name if voice_channel else '`deleted`'}` "
-                                  f"with {text_channel.mention if text_channel else '`deleted`'}",
-                            color=utl.green
-                        )
-                    )
-
-                # moving creator to created channel
-                try:
-                    await member.move_to(voice_channel, reason=f'{member} issued creation')
-                    await send_welcome_message(text_channel, voice_channel)  # send message explaining text channel
-                    
-                # if user already left already
-                except discord.HTTPException as e:
-                    print("Handle HTTP exception during creation of channels - channel was already empty")
-                    await clean_after_exception(voice_channel, text_channel, self.bot,
-                                                archive=archive_category, log_channel=log_channel)
+            # pooled channels are hidden and not handed out yet - nothing to do for them
+            # neither for channels that are being removed right now - static channels stay, so joins count
+            if created_channel and (created_channel.internal_type == pool_type
+                                    or created_channel.internal_type != 'static_channel'
+                                    and not voice_events.is_active(after_channel.id)):
+                created_channel = None
 
-            # channel is in our database - add user to linked text_channel
-            elif created_channel:
+            # joins of trigger channels are handled by admit_creation, outside of the guild slot
+            if creation_type:
+                pass
 
-                # static channels need a new linked text-channel if they were empty before
-                if created_channel.internal_type == 'static_channel' and created_channel.text_channel_id is None:
+            # channel is in our database - add user to linked text_channel
+            # not needed if the bot moved the member here, the text channel was prepared for that move
+            elif created_channel and not expected:
 
-                    try:
-                        tc_overwrite = generate_text_channel_overwrite(after_channel, self.bot.user)
-                        text_channel = await guild.create_text_channel(f"{tc_sign_prefix}{after_channel.name}",
-                                                                       overwrites=tc_overwrite,
-                                                                       category=after_channel.category,
-                                                                       reason="User joined linked voice channel")
-                        created_channel.text_channel_id = text_channel.id
-                        session.add(created_channel)
-                        session.flush()
+                # member came back before the channel was removed - keep the channel
+                self.cancel_tear_down(after_channel.id)
 
-                        await send_welcome_message(text_channel, after_channel)  # send message explaining text channel
+                # channels without linked text-channel - static channels that were empty before
+                # or channels whose text channel is created on demand
+                # a kept text channel of a static channel might have been deleted by hand
+                if created_channel.text_channel_id is None or not guild.get_channel(created_channel.text_channel_id):
+                    threshold = get_lazy_text_threshold(guild.id, session)
 
-                    except discord.HTTPException as e:
-                        # TODO: log this
-                        pass
+                    # static channels get their text channel right away, unless the guild creates them lazily
+                    if (not threshold and created_channel.internal_type == 'static_channel') \
+                            or (threshold and len(after_channel.members) >= threshold):
+                        await self.create_linked_text_channel(after_channel, created_channel, session)
 
                 # processing 'normal', existing linked channel
                 else:
                     # update overwrites to add user to joined channel
-                    # TODO we can skip this API call when the creator just got moved
                     await update_channel_overwrites(after_channel, created_channel, bot_member_on_guild)
 
         if before_channel:
@@ -377,67 +1234,29 @@ class VCCreator(commands.Cog):
             # check db if before channel is a channel that was created by the bot
             created_channel: Union[db.CreatedChannels, None] = channels_db.get_voice_channel_by_id(before_channel.id, session)
 
-            if created_channel:
+            if created_channel and created_channel.internal_type != pool_type \
+                    and voice_events.is_active(before_channel.id):
                 # member left but there are still members in vc
+                # if the bot moved the member out, it updates the overwrites itself
                 if before_channel.members:
-                    # remove user from left linked channel
-                    await update_channel_overwrites(before_channel, created_channel, bot_member_on_guild)
+                    if not expected:
+                        # remove user from left linked channel
+                        await update_channel_overwrites(before_channel, created_channel, bot_member_on_guild)
+
+                # kept breakout rooms wait empty for the next round
+                elif created_channel.internal_type == "breakout_room" \
+                        and breakout_sessions.is_kept_room(guild.id, before_channel.id):
+                    pass
 
-                # left channel is now empty
+                # left channel is now empty - remove it, give members some time to come back if configured
                 else:
-                    # fetch needed information
-                    before_channel_id: int = before_channel.id  # extract id before deleting, needed for db deletion
-                    text_channel: Union[discord.TextChannel, None] = guild.get_channel(created_channel.text_channel_id)
-
-                    # delete channels - catch AttributeErrors to still do the db access and the logging
-
-                    # delete VC only if it's not a static_channel
-                    if created_channel.internal_type != 'static_channel':
-                        try:
-                            await before_channel.delete(reason="Channel is empty")
-                        except AttributeError:
-                            pass
-
-                    # archive or delete linked text channel
-                    try:
-                        archived_channel = await delete_text_channel(text_channel, self.bot, archive=archive_category)
-
-                    except AttributeError:
-                        archived_channel = None
-
-                    except discord.errors.HTTPException:
-                        # occurs when category that the channel shall be moved to is full
-                        archived_channel = None
-                        await log_channel.send(
-                            embed=utl.make_embed(
-                                name="ERROR handling linked text channel",
-                                value=f"This error probably means that the archive `{archive_category.mention}` is full.\n"
-                                      "Please check the category and it and set a new one or delete older channels.\n"
-                                      "Text channel was not deleted",
-                                color=utl.red))
-
-                    if log_channel:
-                        static = True if created_channel.internal_type == 'static_channel' else False  # helper variable
-
-                        await log_channel.send(
-                            embed=utl.make_embed(
-                                name=f"Removed {text_channel.name}" if static else f"Deleted {before_channel.name}",
-                                value=f"{text_channel.mention} was linked to {before_channel.name} and is " if static
-                                      else f"The linked text channel {text_channel.mention} is "
-                                      f"{'moved to archive' if archived_channel is not None and archive_category else 'deleted'}",
-                                color=utl.green
-                            )
-                        )
-
-                    if created_channel.internal_type == 'static_channel':
-                        # remove reference to now archived channel
-                        created_channel.text_channel_id = None
-                        session.add(created_channel)
-                        session.flush()
+                    grace_entry = settings_db.get_first_setting_for(guild.id, "deletion_grace", session)
+                    grace = int(grace_entry.value) if grace_entry else 0
 
+                    if grace:
+                        self.schedule_tear_down(before_channel, grace)
                     else:
-                        # remove deleted channel from database
-                        channels_db.del_channel(before_channel_id)
+                        await self.tear_down(before_channel, created_channel, session, log_channel, archive_category)
 
         session.commit()
         session.close()
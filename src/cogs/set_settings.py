@@ -9,6 +9,11 @@ from environment import PREFIX, CHANNEL_TRACK_LIMIT, MAX_PREFIX_LENGTH
 import database.db_models as db_models
 import database.access_settings_db as settings_db
 import database.access_channels_db as channels_db
+import database.prefix_cache as prefix_cache
+from helpers.admission import overflow_policies
+from helpers.channel_pool import channel_pool
+from helpers.guild_scheduler import guild_scheduler
+from cogs.on_voice_update import static_text_modes
 import utils as utils
 
 logger = logging.getLogger("my-bot")
@@ -40,7 +45,22 @@ settings = {
 
     "allow-edit": "allow_public_rename",
     "ae": "allow_public_rename",
-    "edit": "allow_public_rename"
+    "edit": "allow_public_rename",
+
+    "pool": "channel_pool",
+    "channel-pool": "channel_pool",
+
+    "overflow": "creation_overflow",
+    "of": "creation_overflow",
+
+    "grace": "deletion_grace",
+    "grace-period": "deletion_grace",
+
+    "lazy": "lazy_text_channel",
+    "lazy-text": "lazy_text_channel",
+
+    "static-text": "static_text_mode",
+    "keep-text": "static_text_mode",
 }
 
 
@@ -63,6 +83,15 @@ class Settings(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_before_invoke(self, ctx: commands.Context):
+        # commands share the slots of their guild with the voice handling
+        if ctx.guild:
+            await guild_scheduler.acquire(ctx.guild.id)
+
+    async def cog_after_invoke(self, ctx: commands.Context):
+        if ctx.guild:
+            guild_scheduler.release(ctx.guild.id)
+
     @commands.command(name="settings", aliases=["gs", "get-settings"],
                       help=f"Get a list of all 'watched' channels as well as all other settings\n\n"
                            f"Aliases: `gs`, `get-settings` ")
@@ -289,7 +318,8 @@ class Settings(commands.Cog):
         return None, None
 
     @staticmethod
-    async def validate_toggle(ctx: commands.Context, decision: str) -> Union[Tuple[str, str], Tuple[None, None]]:
+    async def validate_toggle(ctx: commands.Context, decision: str,
+                              setting_type="allow_public_rename") -> Union[Tuple[str, str], Tuple[None, None]]:
         """
         Check if value matches yes_or_no toggle dict\n
         Send error if mapping doesn't work
@@ -297,11 +327,14 @@ class Settings(commands.Cog):
 
         :param ctx: context of the command, used to send a possible message
         :param decision: 'boolean' input of the user to map to True or False
+        :param setting_type: toggle that is set, used to describe the new state
 
-        :returns: ('1' or '0', descriptive string if user can or can't edit) if its valid, else (None, None)
+        :returns: ('1' or '0', descriptive string of the new state) if its valid, else (None, None)
         """
         yes_or_no = yes_no_dict.get(decision, None)
         if yes_or_no is not None:
+            if setting_type != "allow_public_rename":
+                return str(yes_or_no), "enabled" if yes_or_no else "disabled"
             return str(yes_or_no), "creator can edit" if yes_or_no else " creator can _not_ edit"
 
         await ctx.send(embed=utils.make_embed(
@@ -317,6 +350,109 @@ class Settings(commands.Cog):
 
         return None, None
 
+    @staticmethod
+    async def validate_overflow_policy(ctx: commands.Context,
+                                       policy: str) -> Union[Tuple[str, str], Tuple[None, None]]:
+        """
+        Check if value is a known policy for members that can't get a channel right now\n
+        Send error if it's unknown
+
+        :param ctx: context of the command, used to send a possible message
+        :param policy: input of the user
+
+        :returns: (policy, policy) if its valid, else (None, None)
+        """
+        policy = policy.lower()
+        if policy in overflow_policies:
+            return policy, policy
+
+        await ctx.send(embed=utils.make_embed(
+            name="Unknown overflow policy",
+            value="Please use one of these:\n"
+                  "`wait` - the member waits a bit for the channel\n"
+                  "`reuse` - the member is moved to the last channel created for them\n"
+                  "`reject` - the member is informed that no channel can be created right now",
+            color=utils.yellow
+        ))
+        return None, None
+
+    @staticmethod
+    async def validate_static_text_mode(ctx: commands.Context,
+                                        mode: str) -> Union[Tuple[str, str], Tuple[None, None]]:
+        """
+        Check if value is a known mode for linked text channels of static channels\n
+        Send error if it's unknown
+
+        :param ctx: context of the command, used to send a possible message
+        :param mode: input of the user
+
+        :returns: (mode, mode) if its valid, else (None, None)
+        """
+        mode = mode.lower()
+        if mode in static_text_modes:
+            return mode, mode
+
+        await ctx.send(embed=utils.make_embed(
+            name="Unknown mode for static text channels",
+            value="Please use one of these:\n"
+                  "`recreate` - the text channel is archived or deleted, a new one is created on the next join\n"
+                  "`keep` - the text channel is hidden and revealed on the next join\n"
+                  "`purge` - like keep, but messages are deleted when the channel is hidden\n"
+                  "`export` - like purge, but messages are sent to the log channel as a file first",
+            color=utils.yellow
+        ))
+        return None, None
+
+    @staticmethod
+    async def validate_seconds(ctx: commands.Context, seconds: str,
+                               max_seconds=3600) -> Union[Tuple[str, str], Tuple[None, None]]:
+        """
+        Check if value is a number of seconds between 0 and max_seconds\n
+        Send error if it's not
+
+        :param ctx: context of the command, used to send a possible message
+        :param seconds: input of the user
+        :param max_seconds: highest value that is accepted
+
+        :returns: (seconds, readable seconds) if its valid, else (None, None)
+        """
+        if seconds.isdigit() and int(seconds) <= max_seconds:
+            return str(int(seconds)), f"{int(seconds)} seconds"
+
+        await ctx.send(embed=utils.make_embed(
+            name="Not a valid amount of seconds",
+            value=f"Please enter a number of seconds between 0 and {max_seconds}.\n"
+                  f"Example: `{PREFIX}set grace 30`",
+            color=utils.yellow
+        ))
+        return None, None
+
+    @staticmethod
+    async def validate_member_threshold(ctx: commands.Context, members: str,
+                                        max_members=99) -> Union[Tuple[str, str], Tuple[None, None]]:
+        """
+        Check if value is 0 or a number of members between 2 and max_members\n
+        Send error if it's not
+
+        :param ctx: context of the command, used to send a possible message
+        :param members: input of the user
+        :param max_members: highest value that is accepted
+
+        :returns: (members, readable description) if its valid, else (None, None)
+        """
+        if members.isdigit() and (int(members) == 0 or 2 <= int(members) <= max_members):
+            if int(members) == 0:
+                return "0", "created right away"
+            return str(int(members)), f"created at {int(members)} members or on command"
+
+        await ctx.send(embed=utils.make_embed(
+            name="Not a valid amount of members",
+            value=f"Please enter `0` or a number of members between 2 and {max_members}.\n"
+                  f"Example: `{PREFIX}set lazy 3`",
+            color=utils.yellow
+        ))
+        return None, None
+
     @staticmethod
     async def send_setting_updated(ctx: commands.Context, setting_name: str, value_name: str):
         """
@@ -368,6 +504,8 @@ class Settings(commands.Cog):
             entry.value = set_value
             session.add(entry)
             session.commit()
+            if setting_name == "prefix":
+                prefix_cache.invalidate(ctx.guild.id)
 
             # send reply
             await Settings.send_setting_updated(ctx, setting_name, value_name)
@@ -412,6 +550,28 @@ class Settings(commands.Cog):
              f'`{PREFIX}`set [allow-edit | ae] [_yes_ | _no_]\n'
              f'This will only apply to public channels! - Private ones can always be edited.\n'
              f'Default is _no_\n\n'
+             f"__**Keep channels ready for instant creation**__"
+             f'`{PREFIX}`set [pool] [_yes_ | _no_]\n'
+             f'Hidden channels are prepared in the background, so joining members get their channel faster.\n'
+             f'Default is _no_\n\n'
+             f"__**Members joining when too many channels are created at once**__"
+             f'`{PREFIX}`set [overflow] [_wait_ | _reuse_ | _reject_]\n'
+             f'Wait for a free place, move the member to their last channel or send them a message.\n'
+             f'Default is _wait_\n\n'
+             f"__**Keep empty channels for a moment**__"
+             f'`{PREFIX}`set [grace] [_seconds_]\n'
+             f'Members that rejoin within that time keep their channel.\n'
+             f'Default is _0_\n\n'
+             f"__**Create linked text channels on demand**__"
+             f'`{PREFIX}`set [lazy] [_members_]\n'
+             f'Text channels are created once the voice channel has that many members '
+             f'or when a member uses `{PREFIX}text`. Use _99_ to create them on command only, _0_ to disable.\n'
+             f'Default is _0_\n\n'
+             f"__**Keep text channels of static channels**__"
+             f'`{PREFIX}`set [static-text] [_recreate_ | _keep_ | _purge_ | _export_]\n'
+             f'Hide the text channel while the static channel is empty instead of removing it. '
+             f'_purge_ deletes its messages, _export_ sends them to the log channel first.\n'
+             f'Default is _recreate_\n\n'
              "Your setting will be updated if you set it before.\n\n"
              f"Aliases: `add`, `svc`, `sa`, `sl`\n\n")
     @commands.has_permissions(administrator=True)
@@ -466,13 +626,29 @@ class Settings(commands.Cog):
             # need to await since it sends the error message if we can't match
             set_value, set_name = await self.prefix_validation(ctx, value)
 
-        elif setting_type == "allow_public_rename":
-            set_value, set_name = await self.validate_toggle(ctx, value)
+        elif setting_type in ["allow_public_rename", "channel_pool"]:
+            set_value, set_name = await self.validate_toggle(ctx, value, setting_type)
+
+        elif setting_type == "creation_overflow":
+            set_value, set_name = await self.validate_overflow_policy(ctx, value)
+
+        elif setting_type == "deletion_grace":
+            set_value, set_name = await self.validate_seconds(ctx, value)
+
+        elif setting_type == "lazy_text_channel":
+            set_value, set_name = await self.validate_member_threshold(ctx, value)
+
+        elif setting_type == "static_text_mode":
+            set_value, set_name = await self.validate_static_text_mode(ctx, value)
 
         # enter to database if value is correct
         if set_value:
             print(f"{set_value=}")
             await self.update_value_or_create_entry(ctx, setting_type, set_value, set_name)
+
+            # pooled pairs of a disabled pool would stay hidden forever
+            if setting_type == "channel_pool" and set_value == "0":
+                await channel_pool.drain(ctx.guild)
             return  # we're done - the other handling isn't needed
 
         # handle the addition of static channels
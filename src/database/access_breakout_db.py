@@ -0,0 +1,149 @@
+import logging
+from datetime import datetime
+from typing import List, Union
+
+from sqlalchemy import select, delete, update
+
+import database.db_models as db
+
+logger = logging.getLogger('my-bot')
+
+
+# the getters below read with a session of their own - a long living session would return the entries
+# it loaded first from its identity map, like closes_at of a session that was reopened since
+
+
+def get_sessions_by_guild(guild_id: int) -> List[db.BreakoutSessions]:
+    """
+    Get all open breakout sessions of a guild
+
+    :param guild_id: guild to search on
+
+    :return: list of sessions, empty if there are none - detached from their session
+    """
+
+    session = db.open_session()
+    statement = select(db.BreakoutSessions).where(
+        db.BreakoutSessions.guild_id == guild_id
+    )
+
+    entries = [entry[0] for entry in session.execute(statement).all()]
+    session.close()
+    return entries
+
+
+def get_timed_sessions() -> List[db.BreakoutSessions]:
+    """ Get the sessions of all guilds that are closed automatically - detached from their session """
+
+    session = db.open_session()
+    statement = select(db.BreakoutSessions).where(
+        db.BreakoutSessions.closes_at.isnot(None)
+    )
+
+    entries = [entry[0] for entry in session.execute(statement).all()]
+    session.close()
+    return entries
+
+
+def get_rooms_by_sessions(session_ids: List[int]) -> List[db.BreakoutRooms]:
+    """
+    Get the rooms of the given breakout sessions
+
+    :param session_ids: ids of the breakout sessions
+
+    :return: list of rooms, empty if there are none - detached from their session
+    """
+
+    if not session_ids:
+        return []
+
+    session = db.open_session()
+    statement = select(db.BreakoutRooms).where(
+        db.BreakoutRooms.session_id.in_(session_ids)
+    )
+
+    entries = [entry[0] for entry in session.execute(statement).all()]
+    session.close()
+    return entries
+
+
+def add_session(guild_id: int, base_channel_id: int, owner_id: int, created_at=None) -> db.BreakoutSessions:
+    """
+    :param guild_id: guild the session runs on
+    :param base_channel_id: voice channel the rooms were opened from
+    :param owner_id: member who opened the rooms
+    :param created_at: date the session was opened - default is now
+
+    :return: the created entry, detached from its session
+    """
+
+    session = db.open_session()
+
+    entry = db.BreakoutSessions(
+        guild_id=guild_id,
+        base_channel_id=base_channel_id,
+        owner_id=owner_id,
+        created_at=created_at or datetime.now()
+    )
+
+    session.add(entry)
+    session.commit()
+    session.refresh(entry)
+    session.expunge(entry)
+    session.close()
+
+    return entry
+
+
+def set_closes_at(session_id: int, closes_at: Union[datetime, None]):
+    """ Persist the date a session is closed automatically, None if it shall stay open """
+
+    session = db.open_session()
+    session.execute(update(db.BreakoutSessions)
+                    .where(db.BreakoutSessions.id == session_id)
+                    .values(closes_at=closes_at))
+    session.commit()
+    session.close()
+
+
+def set_idle(session_id: int, idle: bool):
+    """ Persist if a session is closed but keeps its rooms for the next round """
+
+    session = db.open_session()
+    session.execute(update(db.BreakoutSessions)
+                    .where(db.BreakoutSessions.id == session_id)
+                    .values(idle=idle))
+    session.commit()
+    session.close()
+
+
+def add_rooms(session_id: int, voice_channel_ids: List[int]):
+    """ Add rooms to a breakout session with one commit """
+
+    session = db.open_session()
+    session.add_all([db.BreakoutRooms(session_id=session_id, voice_channel_id=voice_channel_id)
+                     for voice_channel_id in voice_channel_ids])
+    session.commit()
+    session.close()
+
+
+def del_room(voice_channel_id: int):
+    session = db.open_session()
+
+    statement = delete(db.BreakoutRooms).where(
+        db.BreakoutRooms.voice_channel_id == voice_channel_id
+    )
+    session.execute(statement)
+    session.commit()
+    session.close()
+
+
+def del_session(session_id: int):
+    """ Delete a breakout session and the references to its rooms - the rooms itself are not touched """
+
+    session = db.open_session()
+
+    session.execute(delete(db.BreakoutRooms).where(db.BreakoutRooms.session_id == session_id))
+    session.execute(delete(db.BreakoutSessions).where(db.BreakoutSessions.id == session_id))
+    session.commit()
+    session.close()
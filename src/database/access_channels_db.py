@@ -1,10 +1,11 @@
 import logging
 from datetime import datetime
-from typing import Union, List
+from typing import Union, List, Tuple
 
 from sqlalchemy import select, and_, delete
 
 import database.db_models as db
+import database.channel_index as channel_index
 
 logger = logging.getLogger('my-bot')
 
@@ -42,6 +43,43 @@ def get_channels_by_type(guild_id: int, internal_type: str,
     return [entry[0] for entry in entries] if entries else None
 
 
+def get_channels_by_ids(voice_channel_ids: List[int], session=db.open_session()) -> List[db.CreatedChannels]:
+    """
+    Get the entries of many voice channels with one query
+
+    :param voice_channel_ids: ids of the voice channels
+    :param session: optional if an entry shall be updated
+
+    :return: list of the entries that exist
+    """
+
+    if not voice_channel_ids:
+        return []
+
+    statement = select(db.CreatedChannels).where(
+        db.CreatedChannels.voice_channel_id.in_(voice_channel_ids)
+    )
+
+    return [entry[0] for entry in session.execute(statement).all()]
+
+
+def get_channels_by_guild(guild_id: int, session=db.open_session()) -> List[db.CreatedChannels]:
+    """
+    Get all channels the bot manages on a guild
+
+    :param guild_id: guild to search on
+    :param session: optional if an entry shall be updated
+
+    :return: list of all entries of that guild, empty if there are none
+    """
+
+    statement = select(db.CreatedChannels).where(
+        db.CreatedChannels.guild_id == guild_id
+    )
+
+    return [entry[0] for entry in session.execute(statement).all()]
+
+
 def add_channel(voice_channel_id: int, text_channel_id: str, guild_id: int, internal_type: str,
                 category=None, set_by='unknown', set_date=datetime.now()):
     """
@@ -70,6 +108,42 @@ def add_channel(voice_channel_id: int, text_channel_id: str, guild_id: int, inte
     session.commit()
     session.close()
 
+    channel_index.add(guild_id, voice_channel_id)
+
+
+def add_channels(channels: List[Tuple[int, Union[int, None]]], guild_id: int, internal_type: str,
+                 category=None, set_by='unknown', set_date: Union[datetime, None] = None):
+    """
+    Log many channels of the same kind with one commit - e.g. all rooms of a breakout session
+
+    :param channels: list of (voice channel id, linked text channel id or None)
+    :param guild_id: id of the guild the channels were created on
+    :param internal_type: type of the channels like 'breakout_room'
+    :param category: optional category the channels are in
+    :param set_by: optional which module issued creation
+    :param set_date: date the channels were created - default is now
+    """
+    set_date = set_date or datetime.now()
+
+    session = db.open_session()
+    session.add_all([
+        db.CreatedChannels(
+            voice_channel_id=voice_channel_id,
+            text_channel_id=text_channel_id,
+            guild_id=guild_id,
+            internal_type=internal_type,
+            category=category,
+            set_by=set_by,
+            set_date=set_date
+        )
+        for voice_channel_id, text_channel_id in channels
+    ])
+    session.commit()
+    session.close()
+
+    for voice_channel_id, _ in channels:
+        channel_index.add(guild_id, voice_channel_id)
+
 
 def del_channel(voice_channel_id: int):
     session = db.open_session()
@@ -80,3 +154,41 @@ def del_channel(voice_channel_id: int):
     session.execute(statement)
     session.commit()
     session.close()
+
+    channel_index.discard(voice_channel_id)
+
+
+def del_channels(voice_channel_ids: List[int]):
+    """ Delete the entries of many voice channels with one statement """
+    if not voice_channel_ids:
+        return
+
+    session = db.open_session()
+
+    statement = delete(db.CreatedChannels).where(
+            db.CreatedChannels.voice_channel_id.in_(voice_channel_ids)
+    )
+    session.execute(statement)
+    session.commit()
+    session.close()
+
+    for voice_channel_id in voice_channel_ids:
+        channel_index.discard(voice_channel_id)
+
+
+def set_internal_type(voice_channel_id: int, internal_type: str):
+    """
+    Change the type of an already logged channel - e.g. when a pooled channel is handed out
+
+    :param voice_channel_id: id of the voice channel to update
+    :param internal_type: new type of the channel like 'public_channel'
+    """
+    session = db.open_session()
+
+    entry = get_voice_channel_by_id(voice_channel_id, session)
+    if entry:
+        entry.internal_type = internal_type
+        session.add(entry)
+        session.commit()
+
+    session.close()
@@ -10,6 +10,9 @@ from typing import Union, List
 from sqlalchemy import select, and_, delete
 
 import database.db_models as db
+import database.channel_index as channel_index
+import database.overwrite_templates as overwrite_templates
+import database.prefix_cache as prefix_cache
 from environment import CHANNEL_TRACK_LIMIT
 
 logger = logging.getLogger('my-bot')
@@ -122,6 +125,13 @@ def add_setting(guild_id: int, setting: str, value: Union[str, int],
     session.commit()
     session.close()
 
+    if setting in channel_index.trigger_settings:
+        channel_index.add(guild_id, value)
+    if setting in overwrite_templates.template_settings:
+        overwrite_templates.invalidate_guild(guild_id)
+    if setting == "prefix":
+        prefix_cache.invalidate(guild_id)
+
 
 def del_setting(guild_id: int, setting: str, value: Union[str, int]):
     """
@@ -147,6 +157,13 @@ def del_setting(guild_id: int, setting: str, value: Union[str, int]):
     session.commit()
     session.close()
 
+    if setting in channel_index.trigger_settings:
+        channel_index.invalidate(guild_id)
+    if setting in overwrite_templates.template_settings:
+        overwrite_templates.invalidate_guild(guild_id)
+    if setting == "prefix":
+        prefix_cache.invalidate(guild_id)
+
 
 def del_setting_by_setting(guild_id: int, setting: str):
     """
@@ -167,6 +184,13 @@ def del_setting_by_setting(guild_id: int, setting: str):
     session.commit()
     session.close()
 
+    if setting in channel_index.trigger_settings:
+        channel_index.invalidate(guild_id)
+    if setting in overwrite_templates.template_settings:
+        overwrite_templates.invalidate_guild(guild_id)
+    if setting == "prefix":
+        prefix_cache.invalidate(guild_id)
+
 
 def del_setting_by_value(guild_id: int, value: Union[str, int]):
     """
@@ -190,6 +214,10 @@ def del_setting_by_value(guild_id: int, value: Union[str, int]):
     session.commit()
     session.close()
 
+    channel_index.invalidate(guild_id)
+    overwrite_templates.invalidate_guild(guild_id)
+    prefix_cache.invalidate(guild_id)
+
 
 def is_track_limit_reached(guild_id: int, *channel_types: str) -> bool:
     """
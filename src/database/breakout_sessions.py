@@ -0,0 +1,128 @@
+"""
+In-memory map of open breakout sessions per base channel\n
+-> open and close only look at the rooms of their own session instead of all breakout rooms of a guild\n
+Sessions of a guild are loaded once from the database and kept in sync by the functions below
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Set, Union
+
+import database.access_breakout_db as breakout_db
+
+logger = logging.getLogger('my-bot')
+
+
+class BreakoutSession:
+    __slots__ = ('id', 'guild_id', 'base_channel_id', 'owner_id', 'room_ids', 'created_at', 'closes_at', 'idle')
+
+    def __init__(self, session_id: int, guild_id: int, base_channel_id: int, owner_id: int,
+                 created_at: datetime, room_ids: Set[int] = None, closes_at: Union[datetime, None] = None,
+                 idle=False):
+        self.id = session_id
+        self.guild_id = guild_id
+        self.base_channel_id = base_channel_id
+        self.owner_id = owner_id
+        self.created_at = created_at
+        self.room_ids: Set[int] = room_ids or set()
+        self.closes_at = closes_at
+        self.idle = idle  # closed, but rooms are kept for the next round
+
+
+_sessions: Dict[int, Dict[int, BreakoutSession]] = {}  # guild id: {base channel id: session}
+_rooms: Dict[int, BreakoutSession] = {}                # room voice channel id: session
+
+
+def _load(guild_id: int) -> Dict[int, BreakoutSession]:
+    """ Build the sessions of a guild from the database """
+    entries = breakout_db.get_sessions_by_guild(guild_id)
+    sessions = {entry.id: BreakoutSession(entry.id, entry.guild_id, entry.base_channel_id, entry.owner_id,
+                                          entry.created_at, closes_at=entry.closes_at, idle=bool(entry.idle))
+                for entry in entries}
+
+    for room in breakout_db.get_rooms_by_sessions(list(sessions)):
+        sessions[room.session_id].room_ids.add(room.voice_channel_id)
+        _rooms[room.voice_channel_id] = sessions[room.session_id]
+
+    by_base = _sessions[guild_id] = {s.base_channel_id: s for s in sessions.values()}
+    return by_base
+
+
+def _guild(guild_id: int) -> Dict[int, BreakoutSession]:
+    sessions = _sessions.get(guild_id)
+    if sessions is None:
+        sessions = _load(guild_id)
+    return sessions
+
+
+def get(guild_id: int, base_channel_id: int) -> Union[BreakoutSession, None]:
+    """ Session that was opened from the given channel """
+    return _guild(guild_id).get(base_channel_id)
+
+
+def get_all(guild_id: int) -> List[BreakoutSession]:
+    """ All open sessions of a guild """
+    return list(_guild(guild_id).values())
+
+
+def get_by_id(guild_id: int, session_id: int) -> Union[BreakoutSession, None]:
+    return next((session for session in _guild(guild_id).values() if session.id == session_id), None)
+
+
+def get_by_room(guild_id: int, voice_channel_id: int) -> Union[BreakoutSession, None]:
+    """ Session the given room belongs to """
+    _guild(guild_id)
+    return _rooms.get(voice_channel_id)
+
+
+def open_session(guild_id: int, base_channel_id: int, owner_id: int) -> BreakoutSession:
+    """ Get the session of a base channel - a new one is created if there is none """
+    session = get(guild_id, base_channel_id)
+    if session is None:
+        entry = breakout_db.add_session(guild_id, base_channel_id, owner_id)
+        session = BreakoutSession(entry.id, guild_id, base_channel_id, owner_id, entry.created_at)
+        _sessions[guild_id][base_channel_id] = session
+    return session
+
+
+def set_closes_at(session: BreakoutSession, closes_at: Union[datetime, None]):
+    """ Set the date the session is closed automatically, None if it shall stay open """
+    breakout_db.set_closes_at(session.id, closes_at)
+    session.closes_at = closes_at
+
+
+def set_idle(session: BreakoutSession, idle: bool):
+    """ Mark a session as closed with rooms that are kept for the next round - or as running again """
+    breakout_db.set_idle(session.id, idle)
+    session.idle = idle
+
+
+def is_kept_room(guild_id: int, voice_channel_id: int) -> bool:
+    """ Check if a room belongs to an idle session - it's not removed when it's empty """
+    session = get_by_room(guild_id, voice_channel_id)
+    return session is not None and session.idle
+
+
+def add_rooms(session: BreakoutSession, *voice_channel_ids: int):
+    """ Add rooms to a session """
+    breakout_db.add_rooms(session.id, list(voice_channel_ids))
+    for voice_channel_id in voice_channel_ids:
+        session.room_ids.add(voice_channel_id)
+        _rooms[voice_channel_id] = session
+
+
+def discard_room(guild_id: int, voice_channel_id: int):
+    """ Room was removed - it's not part of its session anymore """
+    _guild(guild_id)
+    session = _rooms.pop(voice_channel_id, None)
+    if session is not None:
+        session.room_ids.discard(voice_channel_id)
+        breakout_db.del_room(voice_channel_id)
+
+
+def close_session(session: BreakoutSession):
+    """ End a session - its rooms aren't touched, they're removed when they're empty """
+    breakout_db.del_session(session.id)
+    _guild(session.guild_id).pop(session.base_channel_id, None)
+    for voice_channel_id in session.room_ids:
+        _rooms.pop(voice_channel_id, None)
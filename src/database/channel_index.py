@@ -0,0 +1,75 @@
+"""
+In-memory index of all channels per guild the bot has to react on\n
+-> trigger channels from the settings and channels that are managed by the bot\n
+The index is loaded once per guild and kept up to date by the database access functions
+"""
+
+import logging
+from typing import Dict, Set, Union
+
+from sqlalchemy import select, and_
+
+import database.db_models as db
+
+logger = logging.getLogger('my-bot')
+
+# settings that mark a channel as channel that triggers the creation of a new channel
+trigger_settings = ("public_channel", "private_channel")
+
+_index: Dict[int, Set[int]] = {}
+
+
+def _load(guild_id: int) -> Set[int]:
+    """ Build the set of interesting channel ids for a guild from the database """
+    session = db.open_session()
+
+    trigger_statement = select(db.Settings.value).where(
+        and_(
+            db.Settings.guild_id == guild_id,
+            db.Settings.setting.in_(trigger_settings)
+        )
+    )
+    created_statement = select(db.CreatedChannels.voice_channel_id).where(
+        db.CreatedChannels.guild_id == guild_id
+    )
+
+    channel_ids = {int(row[0]) for row in session.execute(trigger_statement).all() if row[0]}
+    channel_ids.update(row[0] for row in session.execute(created_statement).all() if row[0])
+    session.close()
+
+    _index[guild_id] = channel_ids
+    return channel_ids
+
+
+def is_interesting(guild_id: int, *channel_ids: Union[int, None]) -> bool:
+    """
+    Check if at least one of the given channels is a trigger channel or a channel managed by the bot
+
+    :param guild_id: guild the channels are on
+    :param channel_ids: ids to check, None values are ignored
+
+    :return: True if one channel is known to the bot
+    """
+    known = _index.get(guild_id)
+    if known is None:
+        known = _load(guild_id)
+
+    return any(channel_id in known for channel_id in channel_ids if channel_id is not None)
+
+
+def add(guild_id: int, channel_id: Union[int, str]):
+    """ Add a channel to the index of a guild - loading the guild is not needed, it'll be loaded on first read """
+    known = _index.get(guild_id)
+    if known is not None:
+        known.add(int(channel_id))
+
+
+def discard(channel_id: Union[int, str]):
+    """ Remove a channel from the index, channel ids are unique so the guild is not needed """
+    for known in _index.values():
+        known.discard(int(channel_id))
+
+
+def invalidate(guild_id: int):
+    """ Drop the index of a guild, it'll be rebuilt on next access """
+    _index.pop(guild_id, None)
@@ -92,6 +92,36 @@ class CreatedChannels(Base):
                f"category='{self.category}', set_by='{self.set_by}', set_date={self.set_date}"
 
 
+class BreakoutSessions(Base):
+    __tablename__ = 'BREAKOUT_SESSIONS'
+
+    id = Column(Integer, primary_key=True)
+    guild_id = Column(BigInteger, index=True)         # guild the session runs on
+    base_channel_id = Column(BigInteger, index=True)  # voice channel the rooms were opened from
+    owner_id = Column(BigInteger)                     # member who opened the rooms
+    created_at = Column(DateTime)                     # date the session was opened
+    closes_at = Column(DateTime, index=True)          # date the rooms are closed automatically, None if never
+    idle = Column(Boolean, default=False)             # closed, but rooms are kept for the next round
+
+    def __repr__(self):
+        return f"BreakoutSession: id='{self.id}', guild_id='{self.guild_id}', " \
+               f"base_channel_id='{self.base_channel_id}', owner_id='{self.owner_id}', " \
+               f"created_at={self.created_at}, closes_at={self.closes_at}, idle={self.idle}"
+
+
+class BreakoutRooms(Base):
+    __tablename__ = 'BREAKOUT_ROOMS'
+
+    # the channels itself are logged in CREATED_CHANNELS as 'breakout_room'
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, index=True)          # session the room belongs to
+    voice_channel_id = Column(BigInteger, index=True)  # voice channel of the room
+
+    def __repr__(self):
+        return f"BreakoutRoom: session_id='{self.session_id}', voice_channel_id='{self.voice_channel_id}'"
+
+
 @event.listens_for(Base.metadata, 'after_create')
 def receive_after_create(target, connection, tables, **kw):
     """listen for the 'after_create' event"""
@@ -0,0 +1,96 @@
+"""
+Pre-built permission overwrites per category and guild\n
+-> creations and updates merge their member overwrites into a cached template instead of rebuilding it\n
+Templates are invalidated by the voice cog on channel and role updates and by the settings access functions
+"""
+
+import logging
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple, Union
+
+import discord
+from sqlalchemy import select, and_
+
+import database.db_models as db
+
+logger = logging.getLogger('my-bot')
+
+Overwrites = Mapping[Union[discord.Role, discord.Member], discord.PermissionOverwrite]
+
+# settings that are part of a template
+template_settings = ("view_tc_role",)
+
+_category_templates: Dict[int, Tuple[int, Overwrites]] = {}  # category id: (guild id, template)
+_text_templates: Dict[int, Overwrites] = {}                  # guild id: template
+
+
+def category_template(category: Union[discord.CategoryChannel, None]) -> Overwrites:
+    """
+    Overwrites of a category, used as base for voice channels created in it
+
+    :param category: category to get the overwrites for, channels without category have no base overwrites
+
+    :return: read only overwrites - use merge() to add overwrites
+    """
+    if category is None:
+        return MappingProxyType({})
+
+    cached = _category_templates.get(category.id)
+    if cached is None:
+        cached = _category_templates[category.id] = (category.guild.id, MappingProxyType(category.overwrites))
+    return cached[1]
+
+
+def text_template(guild: discord.Guild) -> Overwrites:
+    """
+    Overwrites every linked text channel of a guild starts with\n
+    Roles that are registered in the settings can read and write, the default role can't see the channel
+
+    :param guild: guild to get the overwrites for
+
+    :return: read only overwrites - use merge() to add overwrites
+    """
+    cached = _text_templates.get(guild.id)
+    if cached is not None:
+        return cached
+
+    session = db.open_session()
+    statement = select(db.Settings.value).where(
+        and_(
+            db.Settings.guild_id == guild.id,
+            db.Settings.setting == "view_tc_role"
+        )
+    )
+    role_ids = [int(row[0]) for row in session.execute(statement).all() if row[0]]
+    session.close()
+
+    # roles that were deleted since they were registered are skipped
+    roles = [role for role in (guild.get_role(role_id) for role_id in role_ids) if role is not None]
+    template = {role: discord.PermissionOverwrite(view_channel=True, send_messages=True) for role in roles}
+
+    # exclude default role to make channel private
+    template[guild.default_role] = discord.PermissionOverwrite(view_channel=False)
+
+    cached = _text_templates[guild.id] = MappingProxyType(template)
+    return cached
+
+
+def merge(template: Overwrites, delta: Dict[Union[discord.Role, discord.Member], discord.PermissionOverwrite]) \
+        -> Dict[Union[discord.Role, discord.Member], discord.PermissionOverwrite]:
+    """
+    Build overwrites from a template and additional overwrites - delta wins if a target is in both\n
+    Overwrites taken from the template are shared and must not be updated in place
+    """
+    return {**template, **delta}
+
+
+def invalidate_category(category_id: int):
+    """ Overwrites of a category changed or it was deleted """
+    _category_templates.pop(category_id, None)
+
+
+def invalidate_guild(guild_id: int):
+    """ Roles or settings of a guild changed - drop all templates of that guild """
+    _text_templates.pop(guild_id, None)
+    for category_id in [key for key, (guild, _) in _category_templates.items() if guild == guild_id]:
+        del _category_templates[category_id]
@@ -0,0 +1,68 @@
+"""
+Prefixes the bot listens to per guild\n
+-> resolved once per guild instead of querying the settings for every message\n
+The cache is invalidated by the settings access functions and when a prefix is changed
+"""
+
+import logging
+from typing import Dict, FrozenSet, Tuple, Union
+
+from sqlalchemy import select, and_
+
+from environment import PREFIX
+import database.db_models as db
+
+logger = logging.getLogger('my-bot')
+
+_prefixes: Dict[Union[int, None], Tuple[str, ...]] = {}        # guild id, None for DMs: prefixes
+_first_characters: Dict[Union[int, None], FrozenSet[str]] = {}  # guild id, None for DMs: first characters
+
+
+def mentions(bot_id: int) -> Tuple[str, ...]:
+    """ Mentioning the bot works as prefix everywhere """
+    return f'<@!{bot_id}> ', f'<@{bot_id}> '
+
+
+def _load(guild_id: int) -> Tuple[str, ...]:
+    """ Custom prefixes of a guild from the database - the default prefix if there are none """
+    session = db.open_session()
+    statement = select(db.Settings.value).where(
+        and_(
+            db.Settings.guild_id == guild_id,
+            db.Settings.setting == "prefix"
+        )
+    )
+    prefixes = [row[0] for row in session.execute(statement).all() if row[0]]
+    session.close()
+
+    # discord.py uses the first prefix that matches - longer prefixes first, so 'f!' isn't read as 'f'
+    return tuple(sorted(prefixes, key=len, reverse=True)) or (PREFIX,)
+
+
+def get_prefixes(guild_id: Union[int, None], bot_id: int) -> Tuple[str, ...]:
+    """
+    All prefixes the bot reacts to on a guild, including its mentions
+
+    :param guild_id: guild the message was sent on, None for DMs
+    :param bot_id: user id of the bot, used for the mention prefixes
+
+    :return: tuple of prefixes - mentions first
+    """
+    cached = _prefixes.get(guild_id)
+    if cached is None:
+        cached = _prefixes[guild_id] = mentions(bot_id) + (_load(guild_id) if guild_id else (PREFIX,))
+    return cached
+
+
+def get_first_characters(guild_id: Union[int, None], bot_id: int) -> FrozenSet[str]:
+    """ First characters of all prefixes of a guild - messages starting with anything else aren't commands """
+    cached = _first_characters.get(guild_id)
+    if cached is None:
+        cached = _first_characters[guild_id] = frozenset(prefix[0] for prefix in get_prefixes(guild_id, bot_id))
+    return cached
+
+
+def invalidate(guild_id: int):
+    """ Prefixes of a guild changed - they're loaded again on the next message """
+    _prefixes.pop(guild_id, None)
+    _first_characters.pop(guild_id, None)
@@ -35,6 +35,32 @@ VERSION = load_env("VERSION", "unknown")  # version of the bot
 OWNER_NAME = load_env("OWNER_NAME", "unknown")  # owner name with tag e.g. pi#3141
 OWNER_ID = int(load_env("OWNER_ID", "100000000000000000"))  # discord id of the owner
 CHANNEL_TRACK_LIMIT = int(load_env("CHANNEL_TRACK_LIMIT", "20"))  # how many channels tracked per guild
+CHANNEL_POOL_MAX_SIZE = int(load_env("CHANNEL_POOL_MAX_SIZE", "3"))  # max pre-created channel pairs per trigger channel
+CHANNEL_POOL_DEMAND_WINDOW = int(load_env("CHANNEL_POOL_DEMAND_WINDOW", "600"))  # seconds of joins used to size pool
+REST_WORKERS = int(load_env("REST_WORKERS", "10"))  # REST calls that are executed at the same time
+REST_ROUTE_BUDGET = int(load_env("REST_ROUTE_BUDGET", "5"))  # calls per route within REST_ROUTE_WINDOW
+REST_ROUTE_WINDOW = float(load_env("REST_ROUTE_WINDOW", "5"))  # seconds
+REST_MESSAGE_MAX_DELAY = float(load_env("REST_MESSAGE_MAX_DELAY", "30"))  # seconds a message may be deferred
+REST_RETRIES = int(load_env("REST_RETRIES", "2"))  # retries of calls that failed with a server error
+REST_CIRCUIT_THRESHOLD = int(load_env("REST_CIRCUIT_THRESHOLD", "5"))  # failures in a row until calls fail fast
+REST_CIRCUIT_COOLDOWN = float(load_env("REST_CIRCUIT_COOLDOWN", "30"))  # seconds calls fail fast
+LOG_FLUSH_INTERVAL = float(load_env("LOG_FLUSH_INTERVAL", "10"))  # seconds log entries are collected for a digest
+LOG_BATCH_SIZE = int(load_env("LOG_BATCH_SIZE", "10"))  # max entries per digest, at most 25
+CREATION_QUEUE_SIZE = int(load_env("CREATION_QUEUE_SIZE", "20"))  # max queued channel creations per guild
+CREATION_CONCURRENCY = int(load_env("CREATION_CONCURRENCY", "3"))  # channel creations per guild at once
+MEMBER_CREATION_BURST = int(load_env("MEMBER_CREATION_BURST", "2"))  # channels a member can create in a row
+MEMBER_CREATION_PERIOD = float(load_env("MEMBER_CREATION_PERIOD", "60"))  # seconds until a member can create again
+CREATION_MAX_WAIT = float(load_env("CREATION_MAX_WAIT", "30"))  # seconds a creation may wait with policy 'wait'
+RECONCILE_INTERVAL = float(load_env("RECONCILE_INTERVAL", "600"))  # seconds between text channel permission checks
+RECONCILE_PACE = float(load_env("RECONCILE_PACE", "1"))  # seconds between two repairs
+HANDLER_CONCURRENCY = int(load_env("HANDLER_CONCURRENCY", "20"))  # event handlers and commands running at once
+GUILD_CONCURRENCY = int(load_env("GUILD_CONCURRENCY", "4"))  # event handlers and commands per guild running at once
+BREAKOUT_CREATION_CONCURRENCY = int(load_env("BREAKOUT_CREATION_CONCURRENCY", "3"))  # rooms created at once
+BREAKOUT_REMOVAL_CONCURRENCY = int(load_env("BREAKOUT_REMOVAL_CONCURRENCY", "5"))  # rooms removed at once
+MOVE_CONCURRENCY = int(load_env("MOVE_CONCURRENCY", "5"))  # moves per guild in flight when a bulk move starts
+MOVE_MAX_CONCURRENCY = int(load_env("MOVE_MAX_CONCURRENCY", "20"))  # upper bound the bulk move limit grows to
+PROGRESS_INTERVAL = float(load_env("PROGRESS_INTERVAL", "2"))  # seconds between two edits of a status message
+EXPORT_MESSAGE_LIMIT = int(load_env("EXPORT_MESSAGE_LIMIT", "5000"))  # max messages exported of a static text channel
 
 # probably temporary for migration only
 # switch that contains emote IDs for online status display
@@ -11,7 +11,8 @@ import log_setup
 from environment import PREFIX, TOKEN
 import utils
 import database.db_models as db
-import database.access_settings_db as settings_db
+import database.prefix_cache as prefix_cache
+from helpers.message_ingress import message_ingress
 
 logger = logging.getLogger("my-bot")
 
@@ -21,26 +22,20 @@ intents = discord.Intents.all()
 
 # inspired by https://github.com/Rapptz/RoboDanny
 def _prefix_callable(_bot: commands.Bot, msg: discord.Message):
-    user_id = _bot.user.id
-    base = [f'<@!{user_id}> ', f'<@{user_id}> ']
-    if msg.guild is None:  # we're in DMs
-        base.append(PREFIX)
-        return base
-
-    # look if there are custom prefix settings here
-    entries = settings_db.get_all_settings_for(msg.guild.id, "prefix")
-    if entries is not None:
-        prefixes = [entry.value for entry in entries]
-        base.extend(prefixes)
-    else:  # nope boring, using standard prefix
-        base.append(PREFIX)
-    return base
+    # custom prefixes of the guild or the standard prefix - resolved once per guild, not per message
+    return prefix_cache.get_prefixes(msg.guild.id if msg.guild else None, _bot.user.id)
 
 
 # setting prefix and defining bot
 bot = commands.Bot(command_prefix=_prefix_callable, intents=intents)
 
 
+# one ingress for all messages - replaces the default handler, so commands are only processed there
+@bot.event
+async def on_message(message: discord.Message):
+    await message_ingress.dispatch(bot, message)
+
+
 # game = discord.Game('Waiting')
 # login message
 @bot.event
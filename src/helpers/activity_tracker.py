@@ -0,0 +1,65 @@
+"""
+Tracks messages in linked text channels, so teardown can decide between archive and delete without fetching history
+"""
+
+from typing import Dict, Union
+
+import discord
+
+
+class ChannelActivity:
+    __slots__ = ('messages', 'last_author_id')
+
+    def __init__(self):
+        self.messages = 0
+        self.last_author_id: Union[int, None] = None
+
+
+class ActivityTracker:
+    """
+    Knows the message count and the last author of each registered text channel\n
+    Channels are registered on creation, so channels created before a restart are unknown
+    """
+
+    def __init__(self):
+        self._channels: Dict[int, ChannelActivity] = {}
+
+    def register(self, text_channel_id: int):
+        """ Start tracking a newly created and therefore empty text channel """
+        self._channels.setdefault(text_channel_id, ChannelActivity())
+
+    def record(self, message: discord.Message):
+        """ Count a message if it was sent in a tracked channel """
+        activity = self._channels.get(message.channel.id)
+        if activity is not None:
+            activity.messages += 1
+            activity.last_author_id = message.author.id
+
+    def has_messages(self, text_channel_id: int, bot_id: int) -> Union[bool, None]:
+        """
+        Check if there is more than the bots tutorial message in a channel
+
+        :param text_channel_id: channel to check
+        :param bot_id: id of the bot, a single message of the bot doesn't count
+
+        :return: True or False if channel is tracked, None if there is no data for that channel
+        """
+        activity = self._channels.get(text_channel_id)
+        if activity is None:
+            return None
+
+        if activity.messages == 0:
+            return False
+
+        # only this bot has sent a message - probably the tutorial text -> assume empty
+        if activity.messages == 1 and activity.last_author_id == bot_id:
+            return False
+
+        return True
+
+    def forget(self, text_channel_id: int):
+        """ Stop tracking a channel, e.g. when it was deleted or archived """
+        self._channels.pop(text_channel_id, None)
+
+
+activity_tracker = ActivityTracker()
@@ -0,0 +1,186 @@
+"""
+Admission control for the creation of channels\n
+-> a bounded creation queue per guild and a token bucket per member protect against join storms
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import Dict, Tuple, Union
+
+from environment import CREATION_QUEUE_SIZE, CREATION_CONCURRENCY, MEMBER_CREATION_BURST, \
+    MEMBER_CREATION_PERIOD, CREATION_MAX_WAIT
+import helpers.metrics as metrics
+
+# what happens to a member that can't be admitted
+overflow_policies = ("wait", "reuse", "reject")
+
+
+class Verdict(Enum):
+    """ Result of an admission - why a creation wasn't admitted decides what the member is told """
+    ADMITTED = "admitted"
+    MEMBER_LIMIT = "member_limit"    # the member created too many channels lately
+    GUILD_QUEUE = "guild_queue"      # the creation queue of the guild is full
+
+
+class TokenBucket:
+    """ Allows a burst of actions, one action is regained every period """
+
+    def __init__(self, burst: int, period: float):
+        self.burst = burst
+        self.period = period
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """ Seconds until the next token is available, 0 if one is available right now """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.period)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) * self.period
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class GuildQueue:
+    """ Creation queue of one guild """
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.place_freed = asyncio.Condition()
+        self.pending = 0      # admitted creations, waiting or running
+        self.running = 0
+        self.max_pending = 0  # deepest queue seen
+        self.admitted = 0
+        self.rejected = 0
+
+
+class AdmissionControl:
+    """
+    Guards create_new_channels\n
+    - each member can create burst channels, then one per period\n
+    - each guild has at most queue_size admitted creations, concurrency of them are executed at once
+    """
+
+    def __init__(self, queue_size=CREATION_QUEUE_SIZE, concurrency=CREATION_CONCURRENCY,
+                 burst=MEMBER_CREATION_BURST, period=MEMBER_CREATION_PERIOD, max_wait=CREATION_MAX_WAIT):
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.burst = burst
+        self.period = period
+        self.max_wait = max_wait
+
+        self._guilds: Dict[int, GuildQueue] = {}
+        self._buckets: Dict[Tuple[int, int], TokenBucket] = {}
+        self._last_channel: Dict[Tuple[int, int], int] = {}
+        self._channel_owner: Dict[int, Tuple[int, int]] = {}
+
+    def _queue(self, guild_id: int) -> GuildQueue:
+        queue = self._guilds.get(guild_id)
+        if queue is None:
+            queue = self._guilds[guild_id] = GuildQueue(self.concurrency)
+        return queue
+
+    def _bucket(self, guild_id: int, member_id: int) -> TokenBucket:
+        bucket = self._buckets.get((guild_id, member_id))
+        if bucket is None:
+            # drop buckets of members that regained all of their tokens
+            if len(self._buckets) > 10000:
+                self._buckets = {key: value for key, value in self._buckets.items() if value.wait_time()}
+            bucket = self._buckets[(guild_id, member_id)] = TokenBucket(self.burst, self.period)
+        return bucket
+
+    async def _wait_for_place(self, queue: GuildQueue) -> bool:
+        """ Wait up to max_wait seconds until creation() frees a place, returns False if none was freed """
+        try:
+            async with queue.place_freed:
+                await asyncio.wait_for(queue.place_freed.wait_for(lambda: queue.pending < self.queue_size),
+                                       timeout=self.max_wait)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def admit(self, guild_id: int, member_id: int, wait=True) -> Verdict:
+        """
+        Reserve a creation token of the member and a place in the creation queue of a guild
+
+        :param guild_id: guild the channel shall be created on
+        :param member_id: member that issued the creation
+        :param wait: if True a member waits for their next token - one creation per member at a time -
+                     and then up to max_wait seconds for a free place, if False both must be available right away
+
+        :return: ADMITTED - the creation must be run in creation() then, otherwise the reason it wasn't admitted
+        """
+        queue = self._queue(guild_id)
+        bucket = self._bucket(guild_id, member_id)
+
+        # the token is reserved right away, so a second join of the member queues behind the first one
+        delay = bucket.wait_time()
+        if delay and (not wait or delay > self.period):
+            queue.rejected += 1
+            return Verdict.MEMBER_LIMIT
+
+        bucket.consume()
+        if delay:
+            await asyncio.sleep(delay)
+
+        if queue.pending >= self.queue_size and not (wait and await self._wait_for_place(queue)):
+            bucket.tokens += 1  # nothing was created - the member keeps the token
+            queue.rejected += 1
+            return Verdict.GUILD_QUEUE
+
+        queue.pending += 1
+        queue.admitted += 1
+        queue.max_pending = max(queue.max_pending, queue.pending)
+        return Verdict.ADMITTED
+
+    @asynccontextmanager
+    async def creation(self, guild_id: int):
+        """ Run an admitted creation - at most concurrency creations of a guild are run at once """
+        queue = self._queue(guild_id)
+        try:
+            async with queue.semaphore:
+                queue.running += 1
+                try:
+                    yield
+                finally:
+                    queue.running -= 1
+        finally:
+            queue.pending -= 1
+            async with queue.place_freed:
+                queue.place_freed.notify()
+
+    def remember(self, guild_id: int, member_id: int, voice_channel_id: int):
+        """ Remember the last channel that was created for a member - used to reuse it on overflow """
+        self._last_channel[(guild_id, member_id)] = voice_channel_id
+        self._channel_owner[voice_channel_id] = (guild_id, member_id)
+
+    def last_channel(self, guild_id: int, member_id: int) -> Union[int, None]:
+        return self._last_channel.get((guild_id, member_id))
+
+    def forget_channel(self, voice_channel_id: int):
+        """ Channel was deleted and can't be reused anymore """
+        owner = self._channel_owner.pop(voice_channel_id, None)
+        if owner and self._last_channel.get(owner) == voice_channel_id:
+            del self._last_channel[owner]
+
+    def stats(self, guild_id: Union[int, None] = None) -> Dict[str, int]:
+        """ Queue depth of all guilds and of the given guild """
+        stats = {
+            "pending": sum(queue.pending for queue in self._guilds.values()),
+            "running": sum(queue.running for queue in self._guilds.values()),
+            "rejected": sum(queue.rejected for queue in self._guilds.values()),
+            "deepest_queue": max((queue.max_pending for queue in self._guilds.values()), default=0),
+        }
+        queue = self._guilds.get(guild_id)
+        if queue:
+            stats.update(guild_pending=queue.pending, guild_running=queue.running,
+                         guild_admitted=queue.admitted, guild_rejected=queue.rejected,
+                         guild_deepest_queue=queue.max_pending)
+        return stats
+
+
+admission = AdmissionControl()
+metrics.register("creation queue", admission.stats)
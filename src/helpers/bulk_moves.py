@@ -0,0 +1,148 @@
+"""
+Concurrent member moves for commands that move many members at once, like opening and closing breakout rooms\n
+-> the amount of moves in flight per guild grows while moves succeed and is halved when discord limits them
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, List, Tuple, Union
+
+import discord
+
+from environment import MOVE_CONCURRENCY, MOVE_MAX_CONCURRENCY
+import helpers.metrics as metrics
+import helpers.rest_scheduler as rest
+from helpers.rest_scheduler import Priority, RestUnavailable
+
+logger = logging.getLogger('my-bot')
+
+
+class AdaptiveLimit:
+    """ Concurrency limit with additive increase and multiplicative decrease """
+
+    def __init__(self, start: int, maximum: int):
+        self.limit = float(start)
+        self.maximum = maximum
+        self.in_flight = 0
+        self.throttled = 0
+        self._changed = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def success(self):
+        # roughly one more move in flight per round of successful moves
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def limited(self):
+        self.throttled += 1
+        self.limit = max(1.0, self.limit / 2)
+
+
+class MoveReport:
+    """ Result of a bulk move - members that were moved and members that couldn't be moved with the reason """
+
+    def __init__(self):
+        self.moved: List[discord.Member] = []
+        self.failed: List[Tuple[discord.Member, str]] = []
+
+    def describe_failures(self, limit=10) -> str:
+        """ Readable list of the failed moves, cut after limit entries """
+        lines = [f"{member.display_name}: {reason}" for member, reason in self.failed[:limit]]
+        if len(self.failed) > limit:
+            lines.append(f"... and {len(self.failed) - limit} more")
+        return "\n".join(lines)
+
+
+class BulkMover:
+
+    def __init__(self, start=MOVE_CONCURRENCY, maximum=MOVE_MAX_CONCURRENCY):
+        self.start = start
+        self.maximum = maximum
+        self._limits: Dict[int, AdaptiveLimit] = {}
+        self.moved = 0
+        self.failed = 0
+
+    def _limit(self, guild_id: int) -> AdaptiveLimit:
+        limit = self._limits.get(guild_id)
+        if limit is None:
+            limit = self._limits[guild_id] = AdaptiveLimit(self.start, self.maximum)
+        return limit
+
+    async def move(self, moves: List[Tuple[discord.Member, discord.VoiceChannel]], reason: str,
+                   on_result: Union[Callable[[discord.Member, Union[str, None]], None], None] = None) -> MoveReport:
+        """
+        Move members concurrently - all members must be on the same guild
+
+        :param moves: list of (member, channel the member shall be moved to)
+        :param reason: reason shown in the audit log
+        :param on_result: called after each move with the member and the reason of the failure, None on success
+
+        :returns: report of moved and failed members
+        """
+        report = MoveReport()
+        if not moves:
+            return report
+
+        limit = self._limit(moves[0][0].guild.id)
+
+        async def move_one(member: discord.Member, channel: discord.VoiceChannel):
+            failure = await try_move(member, channel)
+            if failure:
+                report.failed.append((member, failure))
+            else:
+                report.moved.append(member)
+
+            if on_result:
+                on_result(member, failure)
+
+        async def try_move(member: discord.Member, channel: discord.VoiceChannel) -> Union[str, None]:
+            if member.voice is None:
+                return "disconnected"
+
+            async with limit:
+                try:
+                    # the adaptive limit paces these moves, so each member is its own route
+                    await rest.run(Priority.MOVE, ("move", member.id),
+                                   lambda: member.move_to(channel, reason=reason))
+
+                except RestUnavailable as e:
+                    limit.limited()
+                    return e.text
+
+                except discord.HTTPException as e:
+                    if e.status == 429:
+                        limit.limited()
+                        return "rate limited"
+                    elif e.status in (400, 404):
+                        # member disconnected while the moves were running
+                        return "disconnected"
+                    return e.text or str(e.status)
+
+                limit.success()
+                return None
+
+        await asyncio.gather(*(move_one(member, channel) for member, channel in moves))
+
+        self.moved += len(report.moved)
+        self.failed += len(report.failed)
+        return report
+
+    def stats(self, guild_id: Union[int, None] = None) -> Dict[str, Union[int, float]]:
+        stats = {"moved": self.moved, "failed": self.failed}
+        limit = self._limits.get(guild_id)
+        if limit:
+            stats.update(guild_limit=round(limit.limit, 2), guild_in_flight=limit.in_flight,
+                         guild_throttled=limit.throttled)
+        return stats
+
+
+bulk_mover = BulkMover()
+metrics.register("bulk moves", bulk_mover.stats)
@@ -0,0 +1,201 @@
+"""
+Pool of pre-created, hidden voice- and text-channel pairs for each trigger channel\n
+-> Handing out a pooled pair only needs a rename, a permission update and a move,
+the pool is refilled in the background afterwards
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Deque, Set, Tuple, Union
+
+import discord
+
+from environment import CHANNEL_POOL_MAX_SIZE, CHANNEL_POOL_DEMAND_WINDOW
+import database.db_models as db
+import database.access_channels_db as channels_db
+import helpers.rest_scheduler as rest
+from helpers.rest_scheduler import Priority
+
+logger = logging.getLogger('my-bot')
+
+pool_channel_name = "⏳reserved"  # name pooled channels have while they're hidden
+pool_type = "pooled_channel"      # internal type of pooled channels in the database
+
+
+class ChannelPool:
+    """
+    Holds hidden channel pairs per trigger channel\n
+    The size of each pool follows the amount of joins on the trigger channel within the demand window
+    """
+
+    def __init__(self, max_size=CHANNEL_POOL_MAX_SIZE, demand_window=CHANNEL_POOL_DEMAND_WINDOW):
+        self.max_size = max_size
+        self.demand_window = demand_window
+        self._pairs: Dict[int, Deque[Tuple[discord.VoiceChannel, discord.TextChannel]]] = {}
+        self._demand: Dict[int, Deque[float]] = {}
+        self._refills: Dict[int, asyncio.Task] = {}
+
+    def _record_demand(self, trigger_id: int):
+        """ Remember a join on the trigger channel, drop joins that are out of the demand window """
+        now = time.monotonic()
+        joins = self._demand.setdefault(trigger_id, deque())
+        joins.append(now)
+        while joins and joins[0] < now - self.demand_window:
+            joins.popleft()
+
+    def target_size(self, trigger_id: int) -> int:
+        """ Amount of pairs that shall be ready for a trigger channel - at least one, at most max_size """
+        return max(1, min(self.max_size, len(self._demand.get(trigger_id, ()))))
+
+    def take(self, trigger_channel: discord.VoiceChannel) -> Union[Tuple[discord.VoiceChannel, discord.TextChannel],
+                                                                   Tuple[None, None]]:
+        """
+        Get a ready pair for a trigger channel if there is one
+
+        :param trigger_channel: channel the member joined to issue the creation
+
+        :returns: pooled voice and text channel or (None, None) if the pool is empty
+        """
+        self._record_demand(trigger_channel.id)
+
+        pairs = self._pairs.get(trigger_channel.id)
+        while pairs:
+            v_channel, t_channel = pairs.popleft()
+            guild = trigger_channel.guild
+
+            # pair was deleted in the meantime or the trigger channel was moved to another category
+            if guild.get_channel(v_channel.id) is None or guild.get_channel(t_channel.id) is None:
+                continue
+            if v_channel.category_id != trigger_channel.category_id:
+                asyncio.create_task(self.discard(v_channel, t_channel))
+                continue
+
+            return v_channel, t_channel
+
+        return None, None
+
+    def schedule_refill(self, trigger_channel: discord.VoiceChannel, bot_member: discord.Member):
+        """ Start refilling the pool in the background, if no refill is running for that trigger channel yet """
+        running = self._refills.get(trigger_channel.id)
+        if running and not running.done():
+            return
+
+        self._refills[trigger_channel.id] = asyncio.create_task(self._refill(trigger_channel, bot_member))
+
+    async def _refill(self, trigger_channel: discord.VoiceChannel, bot_member: discord.Member):
+        pairs = self._pairs.setdefault(trigger_channel.id, deque())
+        try:
+            while len(pairs) < self.target_size(trigger_channel.id):
+                pairs.append(await create_hidden_pair(trigger_channel, bot_member))
+
+        except discord.HTTPException as e:
+            logger.warning(f"Couldn't refill channel pool for {trigger_channel.id} on {trigger_channel.guild.id}: {e}")
+
+    async def drain(self, guild: discord.Guild):
+        """ Stop refilling the pools of a guild and delete all of its pooled pairs, e.g. when the pool is disabled """
+        trigger_ids = [trigger_id for trigger_id in set(self._pairs) | set(self._refills)
+                       if guild.get_channel(trigger_id) is not None]
+
+        refills = [self._refills.pop(trigger_id) for trigger_id in trigger_ids if trigger_id in self._refills]
+        for refill in refills:
+            refill.cancel()
+        await asyncio.gather(*refills, return_exceptions=True)
+
+        for trigger_id in trigger_ids:
+            self._pairs.pop(trigger_id, None)
+            self._demand.pop(trigger_id, None)
+
+        # every pair of the guild is logged - held ones and ones a cancelled refill created
+        await delete_pooled_channels(guild)
+
+    @staticmethod
+    async def discard(v_channel: discord.VoiceChannel, t_channel: discord.TextChannel):
+        """ Remove a pair that can't be used anymore, e.g. because it couldn't be handed out """
+        channels_db.del_channel(v_channel.id)
+        try:
+            for channel in (v_channel, t_channel):
+                await rest.run(Priority.DELETE, ("channel", channel.id),
+                               lambda: channel.delete(reason="Pooled channel is not needed anymore"))
+        except discord.HTTPException:
+            pass
+
+
+async def create_hidden_pair(trigger_channel: discord.VoiceChannel,
+                             bot_member: discord.Member) -> Tuple[discord.VoiceChannel, discord.TextChannel]:
+    """
+    Create a voice- and text-channel pair that is only visible for the bot
+
+    :param trigger_channel: channel the pair is created for, pair will be placed in the same category
+    :param bot_member: bot as member, the only one that can see the channels
+
+    :returns: created voice and text channel
+    """
+    guild: discord.Guild = trigger_channel.guild
+    hidden = discord.PermissionOverwrite(view_channel=False)
+
+    # refills are scheduled behind everything a member is waiting for
+    v_channel = await rest.run(Priority.BACKGROUND, ("channels", guild.id), lambda: guild.create_voice_channel(
+        pool_channel_name, category=trigger_channel.category, reason="Prepared channel for pool",
+        overwrites={guild.default_role: hidden,
+                    bot_member: discord.PermissionOverwrite(view_channel=True, connect=True)}))
+
+    try:
+        t_channel = await rest.run(Priority.BACKGROUND, ("channels", guild.id), lambda: guild.create_text_channel(
+            pool_channel_name, category=trigger_channel.category, reason="Prepared channel for pool",
+            overwrites={guild.default_role: hidden,
+                        bot_member: discord.PermissionOverwrite(view_channel=True)}))
+
+    # don't leave a half pair behind - also if the refill was cancelled
+    except (discord.HTTPException, asyncio.CancelledError):
+        await rest.run(Priority.DELETE, ("channel", v_channel.id),
+                       lambda: v_channel.delete(reason="Preparing pooled channel failed"))
+        raise
+
+    # log to db, so pooled channels can be cleaned up after a restart
+    channels_db.add_channel(v_channel.id, t_channel.id, guild.id, pool_type, trigger_channel.category_id,
+                            set_by="channel_pool")
+
+    return v_channel, t_channel
+
+
+_cleaned_up: Set[int] = set()  # guilds whose pooled channels from a previous run were removed
+
+
+async def clean_up_pooled_channels(guild: discord.Guild):
+    """
+    Delete all pooled channels that are left from a previous run\n
+    Runs once per guild and process - on_ready fires again after reconnects, the pool still holds its pairs then
+    """
+    if guild.id in _cleaned_up:
+        return
+    _cleaned_up.add(guild.id)
+
+    await delete_pooled_channels(guild)
+
+
+async def delete_pooled_channels(guild: discord.Guild):
+    """ Delete all pooled channels of a guild that are logged in the database """
+    # fresh session - pairs are logged and removed in other sessions while the bot runs
+    session = db.open_session()
+    entries = channels_db.get_channels_by_type(guild.id, pool_type, session)
+    session.close()
+    if not entries:
+        return
+
+    for entry in entries:
+        for channel_id in (entry.voice_channel_id, entry.text_channel_id):
+            channel = guild.get_channel(channel_id)
+            if channel:
+                try:
+                    await rest.run(Priority.DELETE, ("channel", channel.id),
+                                   lambda: channel.delete(reason="Removing pooled channel from previous run"))
+                except discord.HTTPException:
+                    pass
+
+        channels_db.del_channel(entry.voice_channel_id)
+
+
+# one pool for all guilds - keyed by trigger channel
+channel_pool = ChannelPool()
@@ -0,0 +1,56 @@
+"""
+Registry of member moves the bot initiates itself\n
+-> the voice handler can skip work for those moves, the initiator already set up the channels involved
+"""
+
+import time
+from typing import Dict, Tuple, Union
+
+import discord
+
+# seconds an expected move is remembered - the event usually arrives within a second
+expected_move_ttl = 30
+
+
+class ExpectedMoves:
+
+    def __init__(self, ttl=expected_move_ttl):
+        self.ttl = ttl
+        self._expected: Dict[Tuple[int, int], Tuple[int, float]] = {}
+
+    def expect(self, member: discord.Member, channel: discord.VoiceChannel):
+        """ Register a move that is about to be issued by the bot """
+        now = time.monotonic()
+
+        # forget moves whose event never arrived
+        if len(self._expected) > 1000:
+            self._expected = {key: value for key, value in self._expected.items() if value[1] > now}
+
+        self._expected[(member.guild.id, member.id)] = (channel.id, now + self.ttl)
+
+    def discard(self, member: discord.Member):
+        """ Move won't happen, e.g. because the request failed """
+        self._expected.pop((member.guild.id, member.id), None)
+
+    def consume(self, member: discord.Member, after_channel: Union[discord.VoiceChannel, None]) -> bool:
+        """
+        Check if a voice event is the result of a move the bot issued - every move matches only once
+
+        :param member: member of the voice event
+        :param after_channel: channel the member is in after the event
+
+        :return: True if the bot expected this move
+        """
+        expected = self._expected.get((member.guild.id, member.id))
+        if expected is None or after_channel is None:
+            return False
+
+        channel_id, deadline = expected
+        if channel_id != after_channel.id:
+            return False
+
+        del self._expected[(member.guild.id, member.id)]
+        return deadline > time.monotonic()
+
+
+expected_moves = ExpectedMoves()
@@ -0,0 +1,141 @@
+"""
+Fair scheduling of handler work across guilds\n
+-> each guild runs a limited amount of handlers at once, free slots are handed to waiting guilds round robin,
+so one busy guild can't starve the others
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Union
+
+from environment import HANDLER_CONCURRENCY, GUILD_CONCURRENCY
+import helpers.metrics as metrics
+
+
+class GuildStats:
+    __slots__ = ('running', 'waited', 'wait_seconds', 'max_wait_seconds')
+
+    def __init__(self):
+        self.running = 0
+        self.waited = 0              # handlers that had to wait for a slot
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+
+class GuildScheduler:
+    """
+    Hands out up to global_limit slots, at most guild_limit of them to the same guild\n
+    Waiting handlers of a guild are served in order, guilds are served round robin
+    """
+
+    def __init__(self, global_limit=HANDLER_CONCURRENCY, guild_limit=GUILD_CONCURRENCY):
+        self.global_limit = global_limit
+        self.guild_limit = guild_limit
+        self.running = 0
+
+        self._stats: Dict[int, GuildStats] = {}
+        self._waiters: Dict[int, Deque[asyncio.Future]] = {}
+        self._ring: Deque[int] = deque()  # guilds with waiting handlers in serving order
+
+    def _guild(self, guild_id: int) -> GuildStats:
+        stats = self._stats.get(guild_id)
+        if stats is None:
+            stats = self._stats[guild_id] = GuildStats()
+        return stats
+
+    def _can_run(self, guild_id: int) -> bool:
+        return self.running < self.global_limit and self._guild(guild_id).running < self.guild_limit
+
+    def _start(self, guild_id: int):
+        self.running += 1
+        self._guild(guild_id).running += 1
+
+    @asynccontextmanager
+    async def slot(self, guild_id: int):
+        """ Run the enclosed handler once the guild got a slot """
+        await self.acquire(guild_id)
+        try:
+            yield
+        finally:
+            self.release(guild_id)
+
+    async def acquire(self, guild_id: int):
+        """ Wait for a slot - every acquire must be followed by a release """
+        # run right away if there is room and nobody of this guild is waiting in front of us
+        if self._can_run(guild_id) and not self._waiters.get(guild_id):
+            self._start(guild_id)
+            return
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.setdefault(guild_id, deque()).append(waiter)
+        if guild_id not in self._ring:
+            self._ring.append(guild_id)
+
+        start = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # slot was handed over just before the cancellation - pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release(guild_id)
+            else:
+                self._waiters[guild_id].remove(waiter)
+            raise
+
+        stats = self._guild(guild_id)
+        waited = time.monotonic() - start
+        stats.waited += 1
+        stats.wait_seconds += waited
+        stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+
+    def release(self, guild_id: int):
+        self.running -= 1
+        self._guild(guild_id).running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """ Hand free slots to waiting guilds, one slot per guild and turn """
+        turns_without_start = 0
+        while self._ring and self.running < self.global_limit and turns_without_start < len(self._ring):
+            guild_id = self._ring.popleft()
+            waiters = self._waiters.get(guild_id)
+
+            # all waiters of this guild were cancelled
+            if not waiters:
+                self._waiters.pop(guild_id, None)
+                continue
+
+            if self._can_run(guild_id):
+                self._start(guild_id)
+                waiters.popleft().set_result(None)
+                turns_without_start = 0
+            else:
+                turns_without_start += 1
+
+            if waiters:
+                self._ring.append(guild_id)
+            else:
+                self._waiters.pop(guild_id, None)
+
+    def stats(self, guild_id: Union[int, None] = None) -> Dict[str, Union[int, float]]:
+        """ Load of all guilds and queue depth and wait times of the given guild """
+        stats = {
+            "running": self.running,
+            "waiting": sum(len(waiters) for waiters in self._waiters.values()),
+            "waiting_guilds": len(self._ring),
+        }
+        guild = self._stats.get(guild_id)
+        if guild:
+            stats.update(guild_running=guild.running,
+                         guild_waiting=len(self._waiters.get(guild_id, ())),
+                         guild_waited=guild.waited,
+                         guild_avg_wait_seconds=round(guild.wait_seconds / guild.waited, 3) if guild.waited else 0,
+                         guild_max_wait_seconds=round(guild.max_wait_seconds, 3))
+        return stats
+
+
+# one scheduler for all cogs
+guild_scheduler = GuildScheduler()
+metrics.register("guild scheduler", guild_scheduler.stats)
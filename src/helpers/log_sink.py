@@ -0,0 +1,114 @@
+"""
+Background delivery of log channel messages\n
+-> log entries are queued per guild and sent as digest embeds, so voice handling never waits for the log channel
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Tuple
+
+import discord
+
+from environment import LOG_FLUSH_INTERVAL, LOG_BATCH_SIZE
+import helpers.rest_scheduler as rest
+from helpers.rest_scheduler import Priority
+import utils as utl
+
+logger = logging.getLogger('my-bot')
+
+# the most severe color of a digest is used for the whole embed
+_severity = [utl.green, utl.yellow, utl.orange, utl.red]
+
+# embeds can't hold more than 25 fields and 6000 characters in total
+_max_fields = 25
+_max_length = 6000
+
+
+def _length(entry: Tuple[str, str, discord.Color]) -> int:
+    """ Characters an entry takes in the digest, names and values are cut to the field limits """
+    return len(entry[0][:256]) + len(entry[1][:1024])
+
+
+def _split_batch(entries: List[Tuple[str, str, discord.Color]], max_batch: int) \
+        -> Tuple[List[Tuple[str, str, discord.Color]], List[Tuple[str, str, discord.Color]]]:
+    """ Take the entries that fit into one digest - by count and by total length - and the remaining ones """
+    length = 0
+    for count, entry in enumerate(entries[:max_batch]):
+        length += _length(entry)
+        # a single entry always fits, it's cut to the field limits
+        if length > _max_length and count:
+            return entries[:count], entries[count:]
+    return entries[:max_batch], entries[max_batch:]
+
+
+class LogSink:
+    """
+    Collects log entries per guild and flushes them as one embed\n
+    A digest is sent when flush_interval passed or when max_batch entries or a full embed of text are waiting
+    """
+
+    def __init__(self, flush_interval=LOG_FLUSH_INTERVAL, max_batch=LOG_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.max_batch = min(max_batch, _max_fields)
+        self._entries: Dict[int, List[Tuple[str, str, discord.Color]]] = {}
+        self._channels: Dict[int, discord.TextChannel] = {}
+        self._full: Dict[int, asyncio.Event] = {}
+        self._flushers: Dict[int, asyncio.Task] = {}
+
+    def post(self, log_channel: discord.TextChannel, name: str, value: str, color=utl.green):
+        """
+        Queue an entry for the log channel of a guild - returns immediately
+
+        :param log_channel: channel the entry shall be sent to
+        :param name: headline of the entry
+        :param value: text of the entry
+        :param color: color of the entry, the most severe color is used for the digest
+        """
+        guild_id = log_channel.guild.id
+        entries = self._entries.setdefault(guild_id, [])
+        entries.append((name, value, color))
+        self._channels[guild_id] = log_channel
+
+        full = self._full.setdefault(guild_id, asyncio.Event())
+        if len(entries) >= self.max_batch or sum(_length(entry) for entry in entries) >= _max_length:
+            full.set()
+
+        flusher = self._flushers.get(guild_id)
+        if flusher is None or flusher.done():
+            self._flushers[guild_id] = asyncio.create_task(self._flush_loop(guild_id))
+
+    async def _flush_loop(self, guild_id: int):
+        """ Flush entries of a guild until the queue is empty """
+        full = self._full[guild_id]
+        while self._entries.get(guild_id):
+            try:
+                await asyncio.wait_for(full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            full.clear()
+
+            batch, rest_entries = _split_batch(self._entries[guild_id], self.max_batch)
+            self._entries[guild_id] = rest_entries
+            if len(rest_entries) >= self.max_batch or sum(_length(entry) for entry in rest_entries) >= _max_length:
+                full.set()
+
+            await self._send(self._channels[guild_id], batch)
+
+    @staticmethod
+    def _make_digest(batch: List[Tuple[str, str, discord.Color]]) -> discord.Embed:
+        color = max((entry[2] for entry in batch), key=lambda c: _severity.index(c) if c in _severity else 0)
+        emby = discord.Embed(title="", color=color)
+        for name, value, _ in batch:
+            emby.add_field(name=name[:256], value=value[:1024], inline=False)
+        return emby
+
+    async def _send(self, log_channel: discord.TextChannel, batch: List[Tuple[str, str, discord.Color]]):
+        try:
+            await rest.run(Priority.MESSAGE, ("messages", log_channel.id),
+                           lambda: log_channel.send(embed=self._make_digest(batch)))
+        except discord.HTTPException as e:
+            logger.warning(f"Couldn't deliver {len(batch)} log entries to {log_channel.id}: {e}")
+
+
+# one sink for all guilds
+log_sink = LogSink()
@@ -0,0 +1,109 @@
+"""
+One entry point for all messages the bot receives\n
+-> activity of linked text channels is recorded for every message, everything else is skipped early:
+messages of bots and webhooks and plain chat that neither starts with a prefix nor matches a listener trigger
+never reach command processing or the listeners
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Tuple, Union
+
+import discord
+from discord.ext import commands
+
+import database.prefix_cache as prefix_cache
+from helpers.activity_tracker import activity_tracker
+import helpers.metrics as metrics
+
+logger = logging.getLogger('my-bot')
+
+Trigger = Callable[[discord.Message], bool]
+Handler = Callable[[discord.Message], Awaitable[None]]
+
+# seconds the early reject rate is measured over
+rate_window = 60
+
+
+class MessageIngress:
+    """
+    Listeners register a cheap trigger and a handler - the handler is only called if the trigger matches\n
+    Commands are only processed if the message starts with a prefix of its guild
+    """
+
+    def __init__(self):
+        self._listeners: List[Tuple[Trigger, Handler]] = []
+        self.seen = 0
+        self.rejected = 0
+        self.commands = 0
+        self.listened = 0
+        self._rejections: Deque[List[int]] = deque()  # [second, rejected messages in that second]
+
+    def add_listener(self, trigger: Trigger, handler: Handler):
+        """
+        :param trigger: function that checks a message without any I/O
+        :param handler: coroutine function that's called with the message if the trigger matched
+        """
+        self._listeners.append((trigger, handler))
+
+    def remove_listener(self, handler: Handler):
+        self._listeners = [(trigger, h) for trigger, h in self._listeners if h != handler]
+
+    def _reject(self):
+        self.rejected += 1
+        second = int(time.monotonic())
+        if self._rejections and self._rejections[-1][0] == second:
+            self._rejections[-1][1] += 1
+        else:
+            self._rejections.append([second, 1])
+            while self._rejections[0][0] <= second - rate_window:
+                self._rejections.popleft()
+
+    async def dispatch(self, bot: commands.Bot, message: discord.Message):
+        """ Hand a message to command processing and to the listeners whose trigger matches """
+        self.seen += 1
+
+        # messages of every author count for the archive decision of linked text channels
+        activity_tracker.record(message)
+
+        if message.author.bot or message.webhook_id:
+            self._reject()
+            return
+
+        content = message.content
+        guild_id = message.guild.id if message.guild else None
+        is_command = content[:1] in prefix_cache.get_first_characters(guild_id, bot.user.id) \
+            and content.startswith(prefix_cache.get_prefixes(guild_id, bot.user.id))
+
+        handlers = [handler for trigger, handler in self._listeners if trigger(message)]
+
+        if not is_command and not handlers:
+            self._reject()
+            return
+
+        if is_command:
+            self.commands += 1
+            await bot.process_commands(message)
+
+        for handler in handlers:
+            self.listened += 1
+            try:
+                await handler(message)
+            except Exception as e:  # one failing listener must not stop the others
+                logger.error(f"Message listener {handler.__qualname__} failed: {e}")
+
+    def stats(self, guild_id: Union[int, None] = None) -> Dict[str, Union[int, float]]:
+        second = int(time.monotonic())
+        recent = sum(count for at, count in self._rejections if at > second - rate_window)
+        return {
+            "seen": self.seen,
+            "rejected_early": self.rejected,
+            "commands": self.commands,
+            "listener_calls": self.listened,
+            "rejected_per_second": round(recent / rate_window, 2),
+        }
+
+
+message_ingress = MessageIngress()
+metrics.register("message ingress", message_ingress.stats)
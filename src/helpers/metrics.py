@@ -0,0 +1,25 @@
+"""
+Registry for runtime metrics of the bots components\n
+-> components register a provider, the admin command 'metrics' collects all of them
+"""
+
+from typing import Dict, Callable, Any, Union
+
+Provider = Callable[[Union[int, None]], Dict[str, Any]]
+
+_providers: Dict[str, Provider] = {}
+
+
+def register(name: str, provider: Provider):
+    """
+    Register a function that returns current metrics
+
+    :param name: name of the section the metrics are listed under
+    :param provider: function that takes an optional guild id and returns a dict of metric names and values
+    """
+    _providers[name] = provider
+
+
+def collect(guild_id: Union[int, None] = None) -> Dict[str, Dict[str, Any]]:
+    """ Get metrics of all registered components, guild specific values are given for the given guild """
+    return {name: provider(guild_id) for name, provider in _providers.items()}
@@ -0,0 +1,124 @@
+"""
+One status message for long running commands, like opening and closing many breakout rooms\n
+-> the message is edited with the current counters at most every PROGRESS_INTERVAL seconds instead of sending
+a message per step, it ends with a summary of the timings and the failures
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Union
+
+import discord
+from discord.ext import commands
+
+from environment import PROGRESS_INTERVAL
+import helpers.rest_scheduler as rest
+from helpers.rest_scheduler import Priority
+import utils
+
+logger = logging.getLogger('my-bot')
+
+
+class Progress:
+
+    def __init__(self, ctx: Union[commands.Context, None], title: str, interval=PROGRESS_INTERVAL):
+        """
+        :param ctx: context of the command, the status message is sent to its channel - None to only count
+        :param title: title of the status message
+        :param interval: minimal seconds between two edits of the message
+        """
+        self.ctx = ctx
+        self.title = title
+        self.interval = interval
+
+        self.counters: Dict[str, List[int]] = {}  # label: [done, total] - shown in the order they were added
+        self.failures: List[str] = []
+        self.timings: List[Tuple[str, float]] = []
+        self.started = time.monotonic()
+
+        self._message: Union[discord.Message, None] = None
+        self._dirty = False
+        self._finished = asyncio.Event()
+        self._task: Union[asyncio.Task, None] = None
+
+    def total(self, label: str, total: int):
+        """ Add a counter - or set the total of an existing one """
+        self.counters.setdefault(label, [0, 0])[1] = total
+        self._changed()
+
+    def advance(self, label: str, amount=1):
+        self.counters[label][0] += amount
+        self._changed()
+
+    def fail(self, text: str):
+        self.failures.append(text)
+        self._changed()
+
+    @contextmanager
+    def phase(self, name: str):
+        """ Measure the enclosed step for the timing summary """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings.append((name, time.monotonic() - start))
+
+    def _changed(self):
+        self._dirty = True
+        if self.ctx and not self._finished.is_set() and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        # show the first change right away, then at most one edit per interval with the latest counters
+        while self._dirty and not self._finished.is_set():
+            self._dirty = False
+            await self._show(utils.make_embed(title=self.title, color=utils.yellow,
+                                              name="In progress...", value=self._describe_counters()))
+            try:
+                await asyncio.wait_for(self._finished.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _show(self, embed: discord.Embed):
+        if self.ctx is None:
+            return
+
+        channel = self.ctx.channel
+        try:
+            if self._message is None:
+                self._message = await rest.run(Priority.MESSAGE, ("messages", channel.id),
+                                               lambda: self.ctx.send(embed=embed))
+            else:
+                await rest.run(Priority.MESSAGE, ("messages", channel.id), lambda: self._message.edit(embed=embed))
+        except discord.HTTPException as e:
+            logger.warning(f"Couldn't update status message in {channel.id}: {e}")
+
+    def _describe_counters(self) -> str:
+        lines = [f"{label}: {done}/{total}" for label, (done, total) in self.counters.items()]
+        if self.failures:
+            lines.append(f"Failed: {len(self.failures)}")
+        return "\n".join(lines) or "Starting..."
+
+    def _describe_failures(self, limit=10) -> str:
+        lines = self.failures[:limit]
+        if len(self.failures) > limit:
+            lines.append(f"... and {len(self.failures) - limit} more")
+        return "\n".join(lines)
+
+    async def finish(self, name: str, value: str):
+        """ Replace the counters by the result, the timing summary and the failures """
+        self._finished.set()
+        if self._task:
+            await self._task
+
+        timings = " · ".join(f"{phase} {seconds:.1f}s" for phase, seconds in self.timings)
+        embed = utils.make_embed(title=self.title, color=utils.yellow if self.failures else utils.green,
+                                 name=name, value=f"{value}\n\n{self._describe_counters()}",
+                                 footer=f"{timings + ' · ' if timings else ''}"
+                                        f"total {time.monotonic() - self.started:.1f}s")
+        if self.failures:
+            embed.add_field(name=f"{len(self.failures)} failed", value=self._describe_failures(), inline=False)
+
+        await self._show(embed)
@@ -0,0 +1,384 @@
+"""
+Central scheduler for outgoing discord REST calls\n
+-> calls are executed by priority, so moves and creations don't wait behind log or welcome messages\n
+Every route has a budget, low priority calls are deferred or dropped when their route is exhausted\n
+Calls have a deadline, transient server errors of idempotent calls are retried and failing routes fail fast for a while
+"""
+
+import asyncio
+import itertools
+import logging
+import random
+import time
+from enum import IntEnum
+from typing import Dict, Tuple, Callable, Awaitable, Any, Union, List
+
+import discord
+
+from environment import REST_WORKERS, REST_ROUTE_BUDGET, REST_ROUTE_WINDOW, REST_MESSAGE_MAX_DELAY, \
+    REST_RETRIES, REST_CIRCUIT_THRESHOLD, REST_CIRCUIT_COOLDOWN
+import helpers.metrics as metrics
+
+logger = logging.getLogger('my-bot')
+
+Route = Tuple[str, int]  # kind of call and id of the object the rate limit applies to, like ('channels', guild_id)
+
+
+class Priority(IntEnum):
+    """ Priority classes - lower values are executed first """
+    MOVE = 0            # moves and creations, a member is waiting for them
+    PERMISSION = 1      # overwrite updates of existing channels
+    DELETE = 2          # deletion and archiving of channels
+    MESSAGE = 3         # log and welcome messages
+    BACKGROUND = 4      # work nobody waits for, like refilling the channel pool
+
+
+# seconds a call may take from scheduling to result, including waiting for its route and retries
+deadlines = {
+    Priority.MOVE: 20.0,
+    Priority.PERMISSION: 30.0,
+    Priority.DELETE: 60.0,
+    Priority.MESSAGE: REST_MESSAGE_MAX_DELAY + 15,
+    Priority.BACKGROUND: 120.0,
+}
+
+
+class RestUnavailable(discord.HTTPException):
+    """
+    Call was not made or didn't finish - it ran into its deadline or discord is failing on that kind of call\n
+    Subclass of HTTPException, so handlers of failed calls handle it the same way
+    """
+
+    def __init__(self, message: str):
+        # there is no response to build the exception from
+        self.response = None
+        self.status = 0
+        self.code = 0
+        self.text = message
+        Exception.__init__(self, message)
+
+
+class CircuitBreaker:
+    """
+    Opens after threshold consecutive failures of one kind of call, calls fail right away while it's open\n
+    After cooldown one trial call is let through, its result closes or opens the circuit again
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Union[float, None] = None
+        self.trial_running = False
+
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """ Check if a call may be made - reserves the trial call when the cooldown passed """
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.cooldown and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def failure(self) -> bool:
+        """ Count a failure, returns True if the circuit opened due to it """
+        self.failures += 1
+        was_open = self.opened_at is not None
+        if self.failures >= self.threshold or self.trial_running:
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+        return self.opened_at is not None and not was_open
+
+
+# kinds of calls that aren't repeated - a creation or message might have gone through before the error
+non_idempotent_kinds = ("channels", "messages", "dm")
+
+
+def is_transient(error: Exception) -> bool:
+    """ Server errors may succeed on the next try """
+    return isinstance(error, discord.HTTPException) and error.status >= 500
+
+
+def is_retried_by_library(error: discord.HTTPException) -> bool:
+    """ discord.py retries 500 and 502 itself before it raises """
+    return error.status in (500, 502)
+
+
+class RouteBudget:
+    """ Token bucket for one route, refilled linearly over the window """
+
+    def __init__(self, capacity: int, window: float):
+        self.capacity = capacity
+        self.window = window
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.window)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """ Seconds until a call can be made on this route, 0 if a call can be made right now """
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.window / self.capacity
+
+    def consume(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        """ Mark route as rate limited by discord """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class _Job:
+    __slots__ = ('priority', 'route', 'factory', 'future', 'created', 'deadline', 'attempts', 'started')
+
+    def __init__(self, priority: Priority, route: Route, factory: Callable[[], Awaitable[Any]],
+                 future: asyncio.Future, timeout: float):
+        self.priority = priority
+        self.route = route
+        self.factory = factory
+        self.future = future
+        self.created = time.monotonic()
+        self.deadline = self.created + timeout
+        self.attempts = 0
+        self.started = False  # a worker made the call
+
+
+class RestScheduler:
+    """
+    Executes REST calls in order of their priority with a fixed amount of workers\n
+    - calls on an exhausted route are put back into the queue once the route has a token again\n
+    - moves, creations and permission edits fail when their route is limited beyond their deadline\n
+    - messages are deferred as well, but dropped when they'd be sent later than max_message_delay\n
+    - server errors of idempotent calls are retried up to retries times, a circuit per route fails calls fast
+    while discord keeps failing them
+    """
+
+    def __init__(self, workers=REST_WORKERS, budget=REST_ROUTE_BUDGET, window=REST_ROUTE_WINDOW,
+                 max_message_delay=REST_MESSAGE_MAX_DELAY, retries=REST_RETRIES,
+                 circuit_threshold=REST_CIRCUIT_THRESHOLD, circuit_cooldown=REST_CIRCUIT_COOLDOWN):
+        self.worker_count = workers
+        self.budget = budget
+        self.window = window
+        self.max_message_delay = max_message_delay
+        self.retries = retries
+        self.circuit_threshold = circuit_threshold
+        self.circuit_cooldown = circuit_cooldown
+
+        self._queue: Union[asyncio.PriorityQueue, None] = None
+        self._workers: List[asyncio.Task] = []
+        self._counter = itertools.count()
+        self._budgets: Dict[Route, RouteBudget] = {}
+
+        self._circuits: Dict[Route, CircuitBreaker] = {}
+
+        self.pending = {priority: 0 for priority in Priority}
+        self.deferred = 0
+        self.shed = 0
+        self.retried = 0
+        self.timed_out = 0
+        self.failed_fast = 0
+        self.circuits_opened = 0
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+
+    def _budget_for(self, route: Route) -> RouteBudget:
+        budget = self._budgets.get(route)
+        if budget is None:
+            # forget routes that are fully recovered, there is one route per channel
+            if len(self._budgets) > 1000:
+                self._budgets = {key: value for key, value in self._budgets.items()
+                                 if value.wait_time() or value.tokens < value.capacity}
+            budget = self._budgets[route] = RouteBudget(self.budget, self.window)
+        return budget
+
+    def _circuit_for(self, route: Route) -> CircuitBreaker:
+        # one circuit per route - a failing guild or channel doesn't make the calls of all other ones fail fast
+        circuit = self._circuits.get(route)
+        if circuit is None:
+            # forget circuits that are closed and didn't fail lately, there is one route per channel
+            if len(self._circuits) > 1000:
+                self._circuits = {key: value for key, value in self._circuits.items()
+                                  if value.is_open() or value.failures}
+            circuit = self._circuits[route] = CircuitBreaker(self.circuit_threshold, self.circuit_cooldown)
+        return circuit
+
+    def _put(self, job: _Job):
+        self._queue.put_nowait((job.priority, next(self._counter), job))
+
+    async def run(self, priority: Priority, route: Route, factory: Callable[[], Awaitable[Any]],
+                  timeout: Union[float, None] = None) -> Any:
+        """
+        Schedule a REST call and wait for its result
+
+        :param priority: priority class of the call
+        :param route: route the call is rate limited on
+        :param factory: function that creates the coroutine to await, like lambda: member.move_to(channel)
+        :param timeout: seconds until the call is given up, default depends on the priority
+
+        :returns: result of the call, None if a message was dropped due to rate limits
+        :raises RestUnavailable: if the deadline passed or the circuit of the call is open - creations and messages
+                                 that were made already aren't given up, so their result isn't lost
+        """
+        self._ensure_started()
+        timeout = timeout or deadlines[priority]
+        job = _Job(priority, route, factory, asyncio.get_event_loop().create_future(), timeout)
+        self.pending[priority] += 1
+        self._put(job)
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout)
+
+        except asyncio.TimeoutError:
+            # a creation or message that was made already can't be taken back - its result is awaited
+            if job.started and route[0] in non_idempotent_kinds:
+                return await job.future
+
+            # a worker won't start the call anymore
+            job.future.cancel()
+            self.timed_out += 1
+            raise RestUnavailable(f"Call on {route} didn't finish within {timeout} seconds")
+
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+
+        finally:
+            self.pending[priority] -= 1
+
+    async def _work(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._execute(job)
+            except Exception as e:  # must never kill the worker
+                logger.error(f"REST scheduler failed to handle job on {job.route}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: _Job):
+        if job.future.done():  # caller was cancelled
+            return
+
+        budget = self._budget_for(job.route)
+        wait = budget.wait_time()
+
+        # route is exhausted - no call holds a worker while it waits, other routes keep being served
+        if wait:
+            if job.priority == Priority.MESSAGE and time.monotonic() + wait - job.created > self.max_message_delay:
+                self.shed += 1
+                logger.info(f"Dropped message call on {job.route} due to rate limits")
+                job.future.set_result(None)
+                return
+
+            # important calls wait for their route - but not longer than their deadline
+            if job.priority < Priority.DELETE and time.monotonic() + wait > job.deadline:
+                self.timed_out += 1
+                job.future.set_exception(RestUnavailable(f"Route {job.route} is limited beyond the deadline"))
+                return
+
+            # back into the queue once the route has a token again, the priority is kept
+            self.deferred += 1
+            asyncio.get_event_loop().call_later(wait, self._put, job)
+            return
+
+        circuit = self._circuit_for(job.route)
+
+        # discord keeps failing this route - don't wait for the next failure
+        if not circuit.allow():
+            self.failed_fast += 1
+            job.future.set_exception(RestUnavailable(f"Calls on {job.route} are failing, try again later"))
+            return
+
+        budget.consume()
+        job.started = True
+        try:
+            # a cancelled creation or message might still be executed by discord, without the caller knowing
+            # about the result - those calls finish, the http timeout of discord.py bounds them
+            if job.route[0] in non_idempotent_kinds:
+                result = await job.factory()
+            else:
+                result = await asyncio.wait_for(job.factory(), max(job.deadline - time.monotonic(), 0.1))
+
+        except asyncio.TimeoutError:
+            # the call might have been executed, so it's not repeated
+            self._record_failure(circuit, job.route)
+            if not job.future.done():
+                job.future.set_exception(RestUnavailable(f"Call on {job.route} timed out"))
+            return
+
+        except discord.HTTPException as e:
+            if e.status == 429:
+                budget.block(self.window)
+
+            if is_transient(e):
+                self._record_failure(circuit, job.route)
+
+                # retry in the queue, so the backoff doesn't hold a worker
+                delay = random.uniform(0.5, 1.5) * 2 ** job.attempts
+                if job.attempts < self.retries and job.route[0] not in non_idempotent_kinds \
+                        and not is_retried_by_library(e) and time.monotonic() + delay < job.deadline:
+                    job.attempts += 1
+                    self.retried += 1
+                    asyncio.get_event_loop().call_later(delay, self._put, job)
+                    return
+            else:
+                circuit.success()  # discord answered properly, the request itself was flawed
+
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+
+        except Exception as e:
+            circuit.trial_running = False  # no answer of discord, the next call is the trial
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+
+        circuit.success()
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def _record_failure(self, circuit: CircuitBreaker, route: Route):
+        if circuit.failure():
+            self.circuits_opened += 1
+            logger.warning(f"Calls on {route} keep failing - failing them fast for {self.circuit_cooldown}s")
+
+    def stats(self) -> Dict[str, int]:
+        """ Current queue depth per priority class and counters of deferred and dropped calls """
+        stats = {f"pending_{priority.name.lower()}": count for priority, count in self.pending.items()}
+        stats.update(deferred=self.deferred, shed=self.shed, limited_routes=sum(
+            1 for budget in self._budgets.values() if budget.wait_time()),
+                     retried=self.retried, timed_out=self.timed_out, failed_fast=self.failed_fast,
+                     circuits_opened=self.circuits_opened,
+                     open_circuits=sum(1 for circuit in self._circuits.values() if circuit.is_open()))
+        return stats
+
+
+# one scheduler for all outgoing calls of the bot
+scheduler = RestScheduler()
+metrics.register("rest scheduler", lambda guild_id: scheduler.stats())
+
+
+async def run(priority: Priority, route: Route, factory: Callable[[], Awaitable[Any]],
+              timeout: Union[float, None] = None) -> Any:
+    """ Shorthand for scheduler.run() """
+    return await scheduler.run(priority, route, factory, timeout)
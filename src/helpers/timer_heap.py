@@ -0,0 +1,95 @@
+"""
+One task that fires many timers\n
+-> timers are kept in a heap ordered by their due time, timers that are due at about the same time
+are handed to the callback in one batch
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Tuple, Union
+
+logger = logging.getLogger('my-bot')
+
+
+class TimerHeap:
+    """
+    Timers are identified by a key, scheduling a key again replaces its timer\n
+    Due times are unix timestamps, so timers can be persisted and scheduled again after a restart
+    """
+
+    def __init__(self, callback: Callable[[List[Hashable]], Awaitable[None]], batch_window=1.0):
+        """
+        :param callback: coroutine function that's called with the keys of all timers that are due
+        :param batch_window: timers due within that many seconds after the first due timer are fired with it
+        """
+        self.callback = callback
+        self.batch_window = batch_window
+
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._due: Dict[Hashable, float] = {}  # live timers - heap entries that don't match are cancelled
+        self._counter = itertools.count()
+        self._changed: Union[asyncio.Event, None] = None
+        self._task: Union[asyncio.Task, None] = None
+
+    def __len__(self):
+        return len(self._due)
+
+    def schedule(self, key: Hashable, due: float):
+        """ Fire key at the unix timestamp due - timers that are due already fire right away """
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, next(self._counter), key))
+
+        if self._task is None or self._task.done():
+            self._changed = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+        # wake the task, the new timer might be the next one
+        self._changed.set()
+
+    def cancel(self, key: Hashable):
+        """ Remove the timer of key if there is one """
+        self._due.pop(key, None)
+
+    def due_at(self, key: Hashable) -> Union[float, None]:
+        return self._due.get(key)
+
+    def _pop_due(self, until: float) -> List[Hashable]:
+        batch = []
+        while self._heap and self._heap[0][0] <= until:
+            due, _, key = heapq.heappop(self._heap)
+            # entry was cancelled or replaced by a later schedule()
+            if self._due.get(key) == due:
+                del self._due[key]
+                batch.append(key)
+        return batch
+
+    def _drop_stale(self):
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    async def _run(self):
+        while True:
+            self._drop_stale()
+            if not self._heap:
+                return
+
+            self._changed.clear()
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                    continue  # timers changed - look at the heap again
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self._pop_due(time.time() + self.batch_window)
+            if not batch:
+                continue
+
+            try:
+                await self.callback(batch)
+            except Exception as e:  # must never kill the timer task
+                logger.error(f"Timer callback failed for {len(batch)} timers: {e}")
@@ -0,0 +1,113 @@
+"""
+Makes voice event handling idempotent\n
+-> events that are replayed after a reconnect are dropped and channels remember whether they're being removed,
+so late or out of order events don't issue REST calls for channels that are already gone
+"""
+
+import time
+from enum import Enum
+from typing import Dict, Tuple, Union
+
+import discord
+
+import helpers.metrics as metrics
+
+# seconds an event is remembered to detect a replay
+event_ttl = 60
+# seconds a removed channel is remembered - late events for it are dropped in that time
+deleted_ttl = 300
+
+EventKey = Tuple[Union[int, None], Union[int, None], Union[str, None]]
+
+
+class ChannelState(Enum):
+    ACTIVE = 0
+    DELETING = 1
+    DELETED = 2
+
+
+class VoiceEventGuard:
+    """
+    Drops duplicated voice events and tracks the state of channels managed by the bot\n
+    A member can't switch from the same channel to the same channel twice in a row,
+    so an event that equals the last event of the member is a replay
+    """
+
+    def __init__(self, event_ttl=event_ttl, deleted_ttl=deleted_ttl):
+        self.event_ttl = event_ttl
+        self.deleted_ttl = deleted_ttl
+        self._last_events: Dict[Tuple[int, int], Tuple[EventKey, float]] = {}
+        self._states: Dict[int, Tuple[ChannelState, float]] = {}
+        self.duplicates = 0
+        self.dropped = 0  # events for channels that are being removed or gone
+
+    def is_duplicate(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState) -> bool:
+        """ Check if this event was handled already - remembers the event if it's new """
+        now = time.monotonic()
+        key = (before.channel.id if before.channel else None,
+               after.channel.id if after.channel else None,
+               after.session_id or before.session_id)
+
+        # forget events of members that left a while ago
+        if len(self._last_events) > 10000:
+            self._last_events = {k: v for k, v in self._last_events.items() if v[1] > now}
+
+        last = self._last_events.get((member.guild.id, member.id))
+        if last is not None and last[0] == key and last[1] > now:
+            self.duplicates += 1
+            return True
+
+        self._last_events[(member.guild.id, member.id)] = (key, now + self.event_ttl)
+        return False
+
+    def state(self, channel_id: int) -> ChannelState:
+        entry = self._states.get(channel_id)
+        return entry[0] if entry else ChannelState.ACTIVE
+
+    def is_active(self, channel_id: int) -> bool:
+        """ Check if events for a channel shall be handled - counts dropped events """
+        if self.state(channel_id) is ChannelState.ACTIVE:
+            return True
+        self.dropped += 1
+        return False
+
+    def begin_deletion(self, channel_id: int) -> bool:
+        """
+        Mark a channel as being removed
+
+        :return: False if the channel is already being removed or gone - the caller must not remove it again
+        """
+        if self.state(channel_id) is not ChannelState.ACTIVE:
+            self.dropped += 1
+            return False
+
+        self._states[channel_id] = (ChannelState.DELETING, time.monotonic())
+        return True
+
+    def finish_deletion(self, channel_id: int, deleted=True):
+        """ Removal is done - channels that were kept (e.g. static channels) are active again """
+        if deleted:
+            self.mark_deleted(channel_id)
+        else:
+            self._states.pop(channel_id, None)
+
+    def mark_deleted(self, channel_id: int):
+        now = time.monotonic()
+
+        # forget channels that were removed a while ago
+        if len(self._states) > 1000:
+            self._states = {k: v for k, v in self._states.items()
+                            if v[0] is not ChannelState.DELETED or v[1] + self.deleted_ttl > now}
+
+        self._states[channel_id] = (ChannelState.DELETED, now)
+
+    def stats(self, guild_id: Union[int, None] = None) -> Dict[str, int]:
+        return {
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "deleting": sum(1 for state, _ in self._states.values() if state is ChannelState.DELETING),
+        }
+
+
+voice_events = VoiceEventGuard()
+metrics.register("voice events", voice_events.stats)